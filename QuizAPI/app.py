@@ -1,19 +1,41 @@
 from datetime import datetime
 from hashlib import md5
-from os import environ
+from hmac import compare_digest
+from os import environ, path
 
-from flask import Flask, request
+from flask import Flask, Response, request, send_file, stream_with_context
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 
+from cache import response_cache
+from images import image_store, image_mimetypes
 from jwt_utils import build_token
+from leaderboard import leaderboard
+from metrics import app_metrics
 from models import db, Question, LoginRequest, LoginResponse, QuizInfo, Score, Participation, APIError, QuestionId, \
-	AnswerSummary, ParticipationResponse
-from pysql import Update, raw_sql
+	ParticipationResponse, scores_reset
+from score_writer import score_writer
+from snapshot import quiz_snapshot
+from tracking import request_tracker
 from utils import returns_json, request_model, requires_authentication
 
 app = Flask(__name__)
 CORS(app)
+# Behind a reverse proxy (e.g. serving the API under /api), its X-Forwarded-* headers give the public URL of the API
+trusted_proxies = int(environ.get("APP_TRUSTED_PROXIES", 0))
+if trusted_proxies:
+	app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies, x_proto=trusted_proxies, x_host=trusted_proxies, x_prefix=trusted_proxies)
+app_metrics.install(app)
+request_tracker.install(app)
+score_writer.install(app)
+
+leaderboard_page_size = 100
+max_leaderboard_page_size = 1000
+participation_top_size = 10
+image_max_age = 365 * 24 * 3600
+# Imports can embed their images, so they are allowed to be much larger than the other payloads
+bulk_max_size = int(environ.get("APP_BULK_MAX_SIZE", 200_000_000))
 
 
 @app.errorhandler(Exception)
@@ -30,9 +52,14 @@ def handle_exception(e):
 @requires_authentication
 @returns_json
 def rebuild_db():
-	for table in db.tables.values():
-		db.execute(table.drop().build_sql()).close()
-		db.execute(table.create().build_sql()).close()
+	with db.transaction():
+		for table in db.tables.values():
+			db.execute(table.drop().build_sql()).close()
+			db.execute(table.create().build_sql()).close()
+			for create_index in table.create_indexes():
+				db.execute(create_index.build_sql()).close()
+		Question.sweep_images()
+		db.touch(scores_reset)
 	return "Ok"
 
 
@@ -49,113 +76,179 @@ def login(payload: LoginRequest):
 
 
 @app.route("/quiz-info", methods=["GET"])
+@response_cache.cached("questions", "scores")
+@request_tracker.query_budget(2)
 @returns_json
 def get_quiz_info():
-	return QuizInfo(Question.count(), *Score.list(order_by=("score", True)))
+	limit = request.args.get("limit", leaderboard_page_size, type=int)
+	if limit <= 0 or limit > max_leaderboard_page_size:
+		raise APIError(f"Invalid leaderboard limit {limit} (must be between 1 and {max_leaderboard_page_size})")
+	cursor = request.args.get("cursor")
+	scores, next_cursor = leaderboard.get_page(limit, Score.parse_cursor(cursor) if cursor else None)
+	return QuizInfo(Question.count(), *scores, next_cursor=next_cursor)
 
 
 @app.route("/questions", methods=["GET"])
+@response_cache.cached("questions", "answer")
 @returns_json
 def list_questions():
 	position = request.args.get("position", -1, type=int)
 	if position >= 0:
-		questions = Question.list("position = :position", position=position)
-		if not questions:
+		question = Question.get_at(position)
+		if not question:
 			raise APIError.not_found("Question by position", position)
-		return questions[0].with_answers()
-	return [question.with_answers() for question in Question.list(order_by="position")]
+		return question.with_answers()
+	return Question.iter_with_answers()
 
 
 @app.route("/questions/<int:question_id>", methods=["GET"])
+@response_cache.cached("questions", "answer", cache_control="private, no-cache")
+@request_tracker.query_budget(3)
 @returns_json
 def get_question(question_id: int):
 	question = Question.get(id=question_id)
 	if not question:
 		raise APIError.not_found("Question", question_id)
-	return question.with_answers()
+	return question.with_position().with_answers()
+
+
+@app.route("/images/<name>", methods=["GET"])
+@returns_json
+def get_image(name: str):
+	if not image_store.exists(name):
+		raise APIError.not_found("Image", name)
+	# Images are named by their content hash, so they never change and can be cached forever
+	res = send_file(path.abspath(image_store.get_path(name)), image_mimetypes[name.rsplit(".", 1)[1]], etag=name.split(".")[0], max_age=image_max_age)
+	res.headers.set("Cache-Control", f"public, max-age={image_max_age}, immutable")
+	return res
+
+
+@app.route("/metrics", methods=["GET"])
+@returns_json
+def get_metrics():
+	token = environ.get("APP_METRICS_TOKEN")
+	if token and not compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+		raise APIError.unauthorized("Invalid metrics token")
+	return Response(app_metrics.export(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/participations", methods=["POST"])
 @request_model(Participation)
+@request_tracker.query_budget(4)
 @returns_json
 def participate(payload: Participation):
-	questions = Question.list(order_by="position")
-	number_of_questions = len(questions)
-	number_of_answers = len(payload.answers)
-	if number_of_answers != number_of_questions:
-		raise APIError(f"Incorrect number of answers, expected {number_of_questions} but received {number_of_answers}")
-	correct_answers = 0
-	summary = []
-	for i in range(number_of_questions):
-		question = questions[i].with_answers()
-		answer = payload.answers[i]
-		number_of_possible_answers = len(question.possible_answers)
-		if answer <= 0 or answer > number_of_possible_answers:
-			raise APIError(f"Invalid answer #{answer} for question #{question.id} (must be between 1 and {number_of_possible_answers})")
-		correct = 0
-		for j, a in enumerate(question.possible_answers):
-			if a.is_correct:
-				correct = j + 1
-		if is_correct := answer == correct:
-			correct_answers += 1
-		summary.append(AnswerSummary(correct, is_correct))
+	summary = quiz_snapshot.get().check(payload.answers)
+	correct_answers = sum(answer_summary.was_correct for answer_summary in summary)
 	score = Score(payload.player_name, correct_answers, datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
-	score.add("id")
-	return ParticipationResponse(score, summary)
+	score_writer.submit(score)
+	rank, top_scores = leaderboard.get_standing(score, participation_top_size)
+	return ParticipationResponse(score, summary, rank, top_scores)
 
 
 @app.route("/questions", methods=["POST"])
 @requires_authentication
 @request_model(Question)
+@request_tracker.query_budget(8)
 @returns_json
+@db.transactional
 def create_question(payload: Question):
-	db.execute(Update(Question.__table__.name).set("position", raw_sql("position + 1")).where("position >= :position").build_sql(), position=payload.position).close()
+	payload.store_image()
+	payload.place_at(payload.position)
 	payload.add("id")
 	payload.save_answers(False)
 	return QuestionId(payload.id)
 
 
+@app.route("/questions/bulk", methods=["POST"])
+@requires_authentication
+@request_model(Question, is_list=True, validator=Question.validate_content, max_content_length=bulk_max_size)
+@returns_json
+@db.transactional
+def import_questions(payload: list[Question]):
+	# Checked before the images are written, so a rejected import leaves no files behind
+	Question.check_positions(payload)
+	created_images = set()
+	try:
+		for question in payload:
+			question.store_image(created_images)
+		Question.add_all(payload)
+	except BaseException:
+		# Written in this transaction, no other question can refer to them yet
+		for image in created_images:
+			image_store.delete(image)
+		raise
+	return [QuestionId(question.id) for question in payload]
+
+
+@app.route("/questions/export", methods=["GET"])
+@requires_authentication
+@returns_json
+def export_questions():
+	# Images can be embedded, so the export can be imported where the image files do not exist
+	inline_images = request.args.get("images") == "inline"
+	# Checked before streaming, so a missing image is left out instead of interrupting the export
+	missing_images = {image for image in Question.get_images() if not image_store.exists(image)}
+
+	def iter_questions():
+		for question in Question.iter_with_answers():
+			if question.image in missing_images:
+				question.image = None
+			elif inline_images and question.image:
+				try:
+					question.image = image_store.get_data_url(question.image)
+				except OSError:
+					# Removed since the check, e.g. by a concurrent update of the question
+					question.image = None
+			yield question
+
+	res = Response(stream_with_context(Question.iter_json_lines(iter_questions())), mimetype="application/x-ndjson")
+	res.headers.set("Content-Disposition", "attachment; filename=questions.ndjson")
+	res.headers.set("X-Missing-Images", str(len(missing_images)))
+	return res
+
+
 @app.route("/questions/<int:question_id>", methods=["PUT"])
 @requires_authentication
 @request_model(Question)
+@request_tracker.query_budget(12)
 @returns_json
+@db.transactional
 def update_question(question_id: int, payload: Question):
 	previous_question = Question.get(id=question_id)
 	if not previous_question:
 		raise APIError.not_found("Question", question_id)
-	if payload.position != previous_question.position:
-		operation = "+" if payload.position < previous_question.position else "-"
-		update_sql = Update(Question.__table__.name)\
-			.set("position", raw_sql(f"position {operation} 1"))\
-			.where("position BETWEEN :position_min AND :position_max AND id <> :id")\
-			.build_sql()
-		position_min = min(payload.position, previous_question.position)
-		position_max = max(payload.position, previous_question.position)
-		db.execute(update_sql, position_min=position_min, position_max=position_max, id=question_id).close()
+	payload.place_at(payload.position, previous_question)
 	payload.id = question_id
+	payload.store_image()
 	payload.save()
 	payload.save_answers()
+	if previous_question.image != payload.image:
+		Question.release_image(previous_question.image)
 	return "", 204
 
 
 @app.route("/questions/<int:question_id>", methods=["DELETE"])
 @requires_authentication
+@request_tracker.query_budget(6)
 @returns_json
+@db.transactional
 def delete_question(question_id: int):
 	question = Question.get(id=question_id)
 	if not question:
 		raise APIError.not_found("Question", question_id)
 	question.delete_answers()
 	question.delete()
-	db.execute(Update(Question.__table__.name).set("position", raw_sql("position - 1")).where("position > :position").build_sql(), position=question.position).close()
+	Question.release_image(question.image)
 	return "", 204
 
 
 @app.route("/questions/all", methods=["DELETE"])
 @requires_authentication
 @returns_json
+@db.transactional
 def delete_all_questions():
 	db.execute(Question.__table__.delete(False).all_rows(True).build_sql()).close()
+	Question.sweep_images()
 	return "", 204
 
 
@@ -163,9 +256,16 @@ def delete_all_questions():
 @requires_authentication
 @returns_json
 def delete_all_scores():
-	db.execute(Score.__table__.delete(False).all_rows(True).build_sql()).close()
+	with db.transaction():
+		db.execute(Score.__table__.delete(False).all_rows(True).build_sql()).close()
+		# Scores still queued by the workers were submitted before the deletion, they are dropped when written
+		db.touch(scores_reset)
 	return "", 204
 
 
+# Created or migrated on import, so gunicorn --preload does it once in the master instead of in the first request of each worker
+db.ensure_schema()
+
+
 if __name__ == "__main__":
 	app.run()
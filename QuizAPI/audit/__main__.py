@@ -0,0 +1,128 @@
+from argparse import ArgumentParser
+from hashlib import md5
+from json import dump, load
+from os import chdir, environ, path
+from sys import exit
+from tempfile import TemporaryDirectory
+
+default_baseline = path.join(path.dirname(path.abspath(__file__)), "baseline.json")
+admin_password = "audit"
+
+
+def exercise_routes(collector) -> list[str]:
+	# Importing the application runs its startup queries
+	collector.source = "startup"
+	from app import app
+	from cache import response_cache
+	from leaderboard import leaderboard
+	from models import Question, question_ranks
+	from snapshot import quiz_snapshot
+
+	collector.source = None
+	client = app.test_client()
+	urls = app.url_map.bind("localhost")
+	token = client.post("/login", json={"password": admin_password}).get_json()["token"]
+	headers = {"Authorization": f"Bearer {token}"}
+	questions = Question.list_with_answers()
+	with app.test_request_context():
+		question = questions[0].to_dict()
+	answers = [1] * len(questions)
+	cursor = client.get("/quiz-info?limit=1").get_json()["nextCursor"]
+	# Writes come last, so the reads run against the seeded data
+	requests = [
+		("GET", "/questions", None),
+		("GET", "/questions?position=1", None),
+		("GET", f"/questions/{question['id']}", None),
+		("GET", question["image"].replace("http://localhost", ""), None),
+		("GET", "/quiz-info", None),
+		("GET", f"/quiz-info?limit=1&cursor={cursor}", None),
+		("GET", "/questions/export", None),
+		("GET", "/metrics", None),
+		("POST", "/login", {"password": admin_password}),
+		("POST", "/participations", {"playerName": "audit", "answers": answers}),
+		("POST", "/questions", dict(question, position=1)),
+		("POST", "/questions/bulk", [dict(question, position=1), dict(question, position=len(questions) + 2)]),
+		("PUT", f"/questions/{question['id']}", dict(question, position=len(questions))),
+		("DELETE", f"/questions/{question['id']}", None),
+		("DELETE", "/participations/all", None),
+		("DELETE", "/questions/all", None),
+		("POST", "/rebuild-db", None)
+	]
+	covered = set()
+	for method, url, payload in requests:
+		response_cache.clear()
+		quiz_snapshot.snapshot = None
+		question_ranks.ranks = None
+		leaderboard.clear()
+		rule, _ = urls.match(url.split("?")[0], method, return_rule=True)
+		covered.add((method, rule.rule))
+		collector.source = f"{method} {rule.rule}"
+		response = client.open(url, method=method, json=payload, headers=headers)
+		response.get_data()
+		response.close()
+		collector.source = None
+		if response.status_code >= 400:
+			print(f"Warning: {method} {url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+	return [f"{method} {rule.rule}" for rule in app.url_map.iter_rules() if rule.endpoint != "static" for method in rule.methods - {"HEAD", "OPTIONS"} if (method, rule.rule) not in covered]
+
+
+def audit(args):
+	with TemporaryDirectory(prefix="quiz-audit-") as directory:
+		# The application opens quiz.db and the images directory relative to the working directory on import
+		chdir(directory)
+		environ["FLASK_DEBUG"] = "0"
+		environ.setdefault("APP_SECRET", "audit")
+		environ["APP_ADMIN_PASSWORD"] = md5(admin_password.encode("UTF-8")).hexdigest()
+		environ.pop("APP_METRICS_TOKEN", None)
+		from models import db
+		from benchmarks.dataset import DatasetSpec, generate_dataset
+		from .plans import ShapeCollector, explain
+
+		generate_dataset(DatasetSpec(questions=20, answers=4, image_size=16, scores=50))
+		collector = ShapeCollector()
+		collector.add_model_queries(db.tables.values())
+		db.add_listener(collector)
+		uncovered = exercise_routes(collector)
+		db.remove_listener(collector)
+		generate_dataset(DatasetSpec(questions=20, answers=4, image_size=16, scores=50))
+		for query_shape in collector.shapes.values():
+			explain(query_shape)
+		db.close()
+
+	baseline = {}
+	if path.isfile(args.baseline) and not args.update_baseline:
+		with open(args.baseline) as file:
+			baseline = load(file)
+	new_findings = 0
+	for query_shape in sorted(collector.shapes.values(), key=lambda query_shape: query_shape.shape):
+		known = set(baseline.get(query_shape.shape, []))
+		new = [finding for finding in query_shape.findings if finding not in known]
+		new_findings += len(new) if not args.update_baseline else 0
+		if query_shape.findings or args.verbose:
+			print(query_shape.shape)
+			print(f"\tfrom: {', '.join(sorted(query_shape.sources))}")
+			for detail in query_shape.plan if args.verbose else []:
+				print(f"\tplan: {detail}")
+			for finding in query_shape.findings:
+				print(f"\t{'NEW ' if finding in new and not args.update_baseline else ''}{finding}")
+	for route in uncovered:
+		print(f"Warning: route {route} is not exercised by the audit")
+	if args.update_baseline:
+		with open(args.baseline, "w") as file:
+			dump({query_shape.shape: query_shape.findings for query_shape in sorted(collector.shapes.values(), key=lambda query_shape: query_shape.shape) if query_shape.findings}, file, indent=2)
+			file.write("\n")
+		print(f"Baseline written to {args.baseline}")
+	elif new_findings:
+		exit(f"{new_findings} new query plan finding(s), fix the queries or indexes, or update the baseline with --update-baseline")
+
+
+def main():
+	parser = ArgumentParser(prog="python -m audit", description="Runs EXPLAIN QUERY PLAN over every query shape of the models and routes, and reports full table scans, temporary B-tree sorts and automatic indexes")
+	parser.add_argument("-b", "--baseline", default=default_baseline, help="JSON file of the accepted findings (default: audit/baseline.json)")
+	parser.add_argument("-u", "--update-baseline", action="store_true", help="accept the current findings as the new baseline")
+	parser.add_argument("-v", "--verbose", action="store_true", help="print the plan of every query shape")
+	audit(parser.parse_args())
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,68 @@
+from re import compile as compile_pattern
+from typing import Iterable
+
+from models import db
+from pysql import QueryListener, Select, Table, Foreign, filter_type, get_statement_shape, join_sql_string, order_select, placeholder, quote_sql_name
+
+explained_statement_pattern = compile_pattern(r"^\s*(?:SELECT|INSERT|REPLACE|UPDATE|DELETE|WITH)\b")
+parameter_pattern = compile_pattern(r"(?<![:\w]):(\w+)")
+
+
+class QueryShape:
+	def __init__(self, shape: str, sql: str):
+		self.shape = shape
+		self.sql = sql
+		self.sources: set[str] = set()
+		self.plan: list[str] = []
+		self.findings: list[str] = []
+
+
+class ShapeCollector(QueryListener):
+	def __init__(self):
+		self.shapes: dict[str, QueryShape] = {}
+		self.source = None
+
+	def add(self, sql: str, source: str):
+		if not explained_statement_pattern.match(sql):
+			return
+		shape = get_statement_shape(sql)
+		query_shape = self.shapes.get(shape)
+		if query_shape is None:
+			query_shape = self.shapes[shape] = QueryShape(shape, sql)
+		query_shape.sources.add(source)
+
+	def query_executed(self, sql: str, lock_wait: float, duration: float, rows_affected: int):
+		if self.source:
+			self.add(sql, self.source)
+
+	def add_model_queries(self, tables: Iterable[Table]):
+		for table in tables:
+			source = f"model {table.python_class.__name__}"
+			self.add(table.select().build_sql(), source)
+			self.add(table.select(True).build_sql(), source)
+			self.add(table.insert().build_sql(), source)
+			self.add(table.update().build_sql(), source)
+			self.add(table.delete().build_sql(), source)
+			self.add(Select().value("count(*)").from_table(table.name).build_sql(), source)
+			for column in table.columns.values():
+				if list(filter_type(column.column_constraints, Foreign)):
+					condition = quote_sql_name(column.sql_name) + join_sql_string(", ", placeholder(f"{column.sql_name}_0"), start=" IN (", end=")")
+					self.add(order_select(table.select().where(condition), table.get_ids()).build_sql(), f"{source}.prefetch")
+
+
+def classify(detail: str) -> str:
+	if detail.startswith("SCAN ") and " USING " not in detail and "CONSTANT ROW" not in detail:
+		return "full table scan"
+	if "TEMP B-TREE" in detail:
+		return "temp b-tree"
+	if "AUTOMATIC" in detail:
+		return "automatic index"
+	return None
+
+
+def explain(query_shape: QueryShape):
+	parameters = {name: None for name in parameter_pattern.findall(query_shape.sql)}
+	cur = db.connection.execute(f"EXPLAIN QUERY PLAN {query_shape.sql}", parameters)
+	query_shape.plan = [row[3] for row in cur.fetchall()]
+	cur.close()
+	query_shape.findings = sorted({f"{kind}: {detail}" for detail in query_shape.plan if (kind := classify(detail))})
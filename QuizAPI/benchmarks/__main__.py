@@ -0,0 +1,89 @@
+from argparse import ArgumentParser
+from fnmatch import fnmatch
+from hashlib import md5
+from json import dump, load
+from os import chdir, environ
+from platform import platform, python_version
+from sys import exit, stdout
+from tempfile import TemporaryDirectory
+
+from .runner import BenchmarkResult, compare_results, format_duration, run_benchmarks
+
+
+def run(args):
+	if args.questions <= 0 or args.answers <= 0:
+		exit("The dataset needs at least one question and one answer per question")
+	with TemporaryDirectory(prefix="quiz-benchmarks-") as directory:
+		# The application opens quiz.db and the images directory relative to the working directory on import
+		chdir(directory)
+		environ["FLASK_DEBUG"] = "0"
+		environ.setdefault("APP_SECRET", "benchmarks")
+		environ.setdefault("APP_ADMIN_PASSWORD", md5(b"benchmarks").hexdigest())
+		from models import db, json
+		from . import endpoints, micro, startup
+		from .dataset import DatasetSpec, generate_dataset
+
+		spec = DatasetSpec(args.questions, args.answers, args.image_size, args.scores, args.seed)
+		generate_dataset(spec)
+		benchmarks = [benchmark for module in (micro, endpoints, startup) for benchmark in module.get_benchmarks(spec) if any(fnmatch(benchmark.name, pattern) for pattern in args.filter or ["*"])]
+
+		def report(result: BenchmarkResult):
+			print(f"{result.name:<40} {format_duration(result.to_dict()['median']):>12}  (x{result.number})", file=stdout, flush=True)
+
+		results = run_benchmarks(benchmarks, args.repeat, args.min_time, report)
+		db.close()
+	if args.output:
+		with open(args.output, "w") as file:
+			dump({
+				"python": python_version(),
+				"platform": platform(),
+				"json_backend": type(json.backend).__name__,
+				"dataset": spec.to_dict(),
+				"benchmarks": results
+			}, file, indent=2)
+
+
+def compare(args):
+	with open(args.baseline) as file:
+		baseline = load(file)
+	with open(args.current) as file:
+		current = load(file)
+	for key in ("dataset", "python", "json_backend"):
+		if baseline.get(key) != current.get(key):
+			print(f"Warning: {key} differs ({baseline.get(key)} != {current.get(key)}), timings may not be comparable")
+	comparisons = compare_results(baseline["benchmarks"], current["benchmarks"], args.threshold)
+	for comparison in comparisons:
+		baseline_time = format_duration(comparison.baseline) if comparison.baseline is not None else "-"
+		current_time = format_duration(comparison.current) if comparison.current is not None else "-"
+		ratio = f"{comparison.ratio:.2f}x" if comparison.ratio is not None else ""
+		print(f"{comparison.name:<40} {baseline_time:>12} {current_time:>12} {ratio:>7}  {comparison.status}")
+	regressions = [comparison.name for comparison in comparisons if comparison.status == "regression"]
+	if regressions:
+		exit(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+
+
+def main():
+	parser = ArgumentParser(prog="python -m benchmarks", description="Offline benchmarks of pysql, pyjson and the quiz API")
+	commands = parser.add_subparsers(dest="command", required=True)
+	run_parser = commands.add_parser("run", help="run the benchmarks on a generated dataset")
+	run_parser.add_argument("-o", "--output", help="write the results to this JSON file")
+	run_parser.add_argument("-k", "--filter", action="append", help="only run the benchmarks matching this glob pattern (repeatable)")
+	run_parser.add_argument("--questions", type=int, default=100, help="number of questions (default: 100)")
+	run_parser.add_argument("--answers", type=int, default=4, help="number of answers per question (default: 4)")
+	run_parser.add_argument("--image-size", type=int, default=0, help="size in bytes of each question image, 0 for none (default: 0)")
+	run_parser.add_argument("--scores", type=int, default=1000, help="number of scores (default: 1000)")
+	run_parser.add_argument("--seed", type=int, default=0, help="random seed of the dataset (default: 0)")
+	run_parser.add_argument("--repeat", type=int, default=5, help="number of timed samples per benchmark (default: 5)")
+	run_parser.add_argument("--min-time", type=float, default=0.05, help="minimum duration in seconds of each sample (default: 0.05)")
+	run_parser.set_defaults(handler=run)
+	compare_parser = commands.add_parser("compare", help="compare results against a baseline")
+	compare_parser.add_argument("baseline", help="baseline results JSON file")
+	compare_parser.add_argument("current", help="current results JSON file")
+	compare_parser.add_argument("-t", "--threshold", type=float, default=0.1, help="relative slowdown of the median flagged as a regression (default: 0.1)")
+	compare_parser.set_defaults(handler=compare)
+	args = parser.parse_args()
+	args.handler(args)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,54 @@
+from random import Random
+
+from images import image_store
+from leaderboard import leaderboard
+from models import db, Question, Answer, Score, sort_key_spacing
+
+
+class DatasetSpec:
+	def __init__(self, questions: int = 100, answers: int = 4, image_size: int = 0, scores: int = 1000, seed: int = 0):
+		self.questions = questions
+		self.answers = answers
+		self.image_size = image_size
+		self.scores = scores
+		self.seed = seed
+
+	def to_dict(self) -> dict:
+		return dict(self.__dict__)
+
+
+def random_text(random: Random, words: int) -> str:
+	return " ".join("".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=random.randint(2, 10))) for _ in range(words))
+
+
+def generate_dataset(spec: DatasetSpec):
+	random = Random(spec.seed)
+	with db.transaction():
+		for table in db.tables.values():
+			db.execute(table.drop().build_sql()).close()
+			db.execute(table.create().build_sql()).close()
+			for create_index in table.create_indexes():
+				db.execute(create_index.build_sql()).close()
+		questions = []
+		for position in range(1, spec.questions + 1):
+			image = image_store.save(random.randbytes(spec.image_size), "image/png") if spec.image_size else None
+			question = Question(random_text(random, 20), random_text(random, 4), image, position, [])
+			question.sort_key = position * sort_key_spacing
+			questions.append(question)
+		Question.add_many(questions, "id")
+		answers = []
+		for question in questions:
+			correct = random.randrange(spec.answers)
+			for i in range(spec.answers):
+				answer = Answer(random_text(random, 6), i == correct)
+				answer.question = question.id
+				answers.append(answer)
+		Answer.add_many(answers, "id")
+		scores = [Score(random_text(random, 1), random.randint(0, spec.questions), f"{random.randint(1, 28):02}/{random.randint(1, 12):02}/2023 12:00:00") for _ in range(spec.scores)]
+		Score.add_many(scores, "id")
+	leaderboard.clear()
+
+
+def random_participation(spec: DatasetSpec, random: Random = None) -> dict:
+	random = random or Random(spec.seed)
+	return {"playerName": random_text(random, 1), "answers": [random.randint(1, spec.answers) for _ in range(spec.questions)]}
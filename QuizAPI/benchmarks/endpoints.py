@@ -0,0 +1,43 @@
+from random import Random
+
+from app import app
+from cache import response_cache
+from models import Question
+from .dataset import DatasetSpec, random_participation
+from .runner import Benchmark
+
+
+def request(client, method: str, url: str, expected_status: int = 200, **kwargs):
+	def send():
+		res = client.open(url, method=method, **kwargs)
+		# Reading the body also consumes streamed responses
+		if res.get_data() is None or res.status_code != expected_status:
+			raise AssertionError(f"{method} {url} returned {res.status_code}: {res.get_data(as_text=True)[:200]}")
+	return send
+
+
+def uncached(send):
+	def send_uncached():
+		response_cache.clear()
+		send()
+	return send_uncached
+
+
+def get_benchmarks(spec: DatasetSpec) -> list[Benchmark]:
+	client = app.test_client()
+	question_id = Question.list(limit=1)[0].id if spec.questions else 0
+	random = Random(spec.seed)
+	participations = [random_participation(spec, random) for _ in range(100)]
+
+	def participate():
+		participation = participations.pop()
+		participations.insert(0, participation)
+		request(client, "POST", "/participations", json=participation)()
+
+	benchmarks = []
+	for name, url in (("questions", "/questions"), ("questions_by_position", "/questions?position=1"), ("question", f"/questions/{question_id}"), ("quiz_info", "/quiz-info")):
+		send = request(client, "GET", url)
+		benchmarks.append(Benchmark(f"endpoint.{name}", uncached(send)))
+		benchmarks.append(Benchmark(f"endpoint.{name}.cached", send, setup=send))
+	benchmarks.append(Benchmark("endpoint.participations", participate))
+	return benchmarks
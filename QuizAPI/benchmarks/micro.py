@@ -0,0 +1,37 @@
+from app import app
+from models import db, json, Question, Answer, Score, QuizInfo, Participation
+from pysql import Select, Update, bind_many, bind_object, placeholder
+from .dataset import DatasetSpec, random_participation
+from .runner import Benchmark
+
+
+def get_benchmarks(spec: DatasetSpec) -> list[Benchmark]:
+	question_table = Question.__table__
+	answer_table = Answer.__table__
+	answers_cursor = db.execute(answer_table.select().build_sql())
+	answer_rows = answers_cursor.fetchall()
+	answers_cursor.close()
+	with app.test_request_context():
+		questions = Question.list_with_answers()
+		questions_json = Question.to_json_list_bytes(*questions)
+	quiz_info = QuizInfo(len(questions), *Score.list(None, [("score", True), "id"], 100))
+	participation_json = json.backend.dumps(random_participation(spec))
+
+	def encode_questions():
+		with app.test_request_context():
+			Question.to_json_list_bytes(*questions)
+
+	return [
+		Benchmark("sql.select", lambda: question_table.select(True).build_sql()),
+		Benchmark("sql.select_ordered", lambda: Select().from_table(question_table.name).column("id").where("sort_key >= :sort_key").order_by("sort_key").with_limit(100).build_sql()),
+		Benchmark("sql.insert", lambda: answer_table.insert("id").build_sql()),
+		Benchmark("sql.insert_many", lambda: answer_table.insert("id", rows=100).build_sql()),
+		Benchmark("sql.update", lambda: question_table.update().build_sql()),
+		Benchmark("sql.update_sort_key", lambda: Update(question_table.name).set("sort_key", placeholder("sort_key")).where("id = :id").build_sql()),
+		Benchmark("bind.object", lambda: bind_object(answer_table, answers_cursor, answer_rows[0], Answer.__new__(Answer))),
+		Benchmark("bind.many", lambda: bind_many(answer_table, answers_cursor, answer_rows)),
+		Benchmark("json.encode_questions", encode_questions),
+		Benchmark("json.decode_questions", lambda: Question.from_json_list(questions_json)),
+		Benchmark("json.encode_quiz_info", lambda: quiz_info.to_json_bytes()),
+		Benchmark("json.decode_participation", lambda: Participation.from_json(participation_json))
+	]
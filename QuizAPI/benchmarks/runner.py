@@ -0,0 +1,96 @@
+from gc import collect, disable, enable, isenabled
+from statistics import mean, median
+from time import perf_counter
+from typing import Callable, Iterable
+
+
+class Benchmark:
+	def __init__(self, name: str, function: Callable[[], object], setup: Callable[[], object] = None):
+		self.name = name
+		self.function = function
+		self.setup = setup
+
+	def measure(self, repeat: int = 5, min_time: float = 0.05) -> "BenchmarkResult":
+		if self.setup:
+			self.setup()
+		self.function()
+		number = 1
+		while self.time(number) < min_time and number < 1_000_000:
+			number *= 2
+		samples = [self.time(number) / number for _ in range(repeat)]
+		return BenchmarkResult(self.name, number, samples)
+
+	def time(self, number: int) -> float:
+		gc_enabled = isenabled()
+		collect()
+		disable()
+		try:
+			function = self.function
+			start = perf_counter()
+			for _ in range(number):
+				function()
+			return perf_counter() - start
+		finally:
+			if gc_enabled:
+				enable()
+
+
+class BenchmarkResult:
+	def __init__(self, name: str, number: int, samples: list[float]):
+		self.name = name
+		self.number = number
+		self.samples = samples
+
+	def to_dict(self) -> dict:
+		return {
+			"number": self.number,
+			"min": min(self.samples),
+			"median": median(self.samples),
+			"mean": mean(self.samples),
+			"max": max(self.samples),
+			"samples": self.samples
+		}
+
+
+class Comparison:
+	def __init__(self, name: str, baseline: float = None, current: float = None, threshold: float = 0.1):
+		self.name = name
+		self.baseline = baseline
+		self.current = current
+		if baseline is None:
+			self.ratio, self.status = None, "new"
+		elif current is None:
+			self.ratio, self.status = None, "missing"
+		else:
+			self.ratio = current / baseline
+			if self.ratio > 1 + threshold:
+				self.status = "regression"
+			elif self.ratio < 1 / (1 + threshold):
+				self.status = "improvement"
+			else:
+				self.status = "ok"
+
+	def to_dict(self) -> dict:
+		return {"baseline": self.baseline, "current": self.current, "ratio": self.ratio, "status": self.status}
+
+
+def run_benchmarks(benchmarks: Iterable[Benchmark], repeat: int = 5, min_time: float = 0.05, report: Callable[[BenchmarkResult], None] = None) -> dict[str, dict]:
+	results = {}
+	for benchmark in benchmarks:
+		result = benchmark.measure(repeat, min_time)
+		results[result.name] = result.to_dict()
+		if report:
+			report(result)
+	return results
+
+
+def compare_results(baseline: dict[str, dict], current: dict[str, dict], threshold: float = 0.1) -> list[Comparison]:
+	names = list(baseline) + [name for name in current if name not in baseline]
+	return [Comparison(name, baseline.get(name, {}).get("median"), current.get(name, {}).get("median"), threshold) for name in names]
+
+
+def format_duration(seconds: float) -> str:
+	for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+		if seconds >= scale:
+			return f"{seconds / scale:.2f} {unit}"
+	return f"{seconds / 1e-9:.0f} ns"
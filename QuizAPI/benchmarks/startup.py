@@ -0,0 +1,32 @@
+from itertools import count
+from os import environ, getcwd, makedirs, path
+from subprocess import run
+from sys import executable
+
+from .dataset import DatasetSpec
+from .runner import Benchmark
+
+application_directory = path.dirname(path.dirname(path.abspath(__file__)))
+first_request = "from app import app\nresponse = app.test_client().get('/questions')\nresponse.get_data()\nassert response.status_code == 200, response.status_code"
+
+
+def start(code: str, directory: str):
+	# A new interpreter is started each time, so the import and schema bootstrap costs are measured as a worker would pay them
+	run([executable, "-c", code], cwd=directory, env=dict(environ, PYTHONPATH=application_directory), check=True)
+
+
+def get_benchmarks(spec: DatasetSpec) -> list[Benchmark]:
+	# The current directory holds the seeded database, each cold start uses a new empty directory
+	warm_directory = getcwd()
+	cold_directories = (path.join(warm_directory, "cold", str(i)) for i in count())
+
+	def cold_start():
+		directory = next(cold_directories)
+		makedirs(directory)
+		start("import app", directory)
+
+	return [
+		Benchmark("startup.import_cold", cold_start),
+		Benchmark("startup.import_warm", lambda: start("import app", warm_directory)),
+		Benchmark("startup.first_request_warm", lambda: start(first_request, warm_directory))
+	]
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from functools import wraps
+from os import environ
+from threading import Lock
+from typing import Hashable, Optional, Callable, Iterable, Iterator
+
+from flask import Response, request
+
+from metrics import app_metrics
+from models import db
+
+
+class CacheEntry:
+	def __init__(self, body: bytes, status: int, content_type: str, versions: tuple[int, ...]):
+		self.body = body
+		self.status = status
+		self.content_type = content_type
+		self.versions = versions
+
+	def to_response(self) -> Response:
+		return Response(self.body, self.status, content_type=self.content_type)
+
+
+class ResponseCache:
+	def __init__(self, get_versions: Callable[..., tuple[int, ...]], max_size: int = 32_000_000):
+		self.get_versions = get_versions
+		self.max_size = max_size
+		self.size = 0
+		self.entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+		self._lock = Lock()
+
+	def get(self, key: Hashable, versions: tuple[int, ...]) -> Optional[CacheEntry]:
+		with self._lock:
+			entry = self.entries.get(key)
+			if entry is not None and entry.versions != versions:
+				self.size -= len(self.entries.pop(key).body)
+				entry = None
+			if entry is not None:
+				self.entries.move_to_end(key)
+		# Counted by the metrics, which have their own lock and are merged across the workers
+		app_metrics.record_response_cache("miss" if entry is None else "hit")
+		return entry
+
+	def put(self, key: Hashable, entry: CacheEntry):
+		if len(entry.body) > self.max_size:
+			return
+		with self._lock:
+			previous = self.entries.pop(key, None)
+			if previous is not None:
+				self.size -= len(previous.body)
+			self.entries[key] = entry
+			self.size += len(entry.body)
+			while self.size > self.max_size:
+				_, evicted = self.entries.popitem(last=False)
+				self.size -= len(evicted.body)
+
+	def record(self, key: Hashable, entry: CacheEntry, chunks: Iterable[bytes]) -> Iterator[bytes]:
+		body = []
+		size = 0
+		for chunk in chunks:
+			yield chunk
+			if size <= self.max_size:
+				body.append(chunk)
+				size += len(chunk)
+		entry.body = b"".join(body)
+		self.put(key, entry)
+
+	def clear(self):
+		with self._lock:
+			self.entries.clear()
+			self.size = 0
+
+	def cached(self, *tables: str, cache_control: str = "no-cache"):
+		def decorator(handler):
+			@wraps(handler)
+			def wrapper(*args, **kwargs):
+				# Read before building the response, so a concurrent write leaves the entry outdated instead of stale
+				versions = self.get_versions(*tables)
+				# Versions are stored in the database, so every worker computes the same ETag for the same data
+				etag = "-".join(map(str, versions))
+				if request.if_none_match.contains(etag):
+					app_metrics.record_response_cache("not_modified")
+					res = Response(status=304)
+				else:
+					# Responses hold absolute URLs, so they depend on the scheme, host and path prefix of the request
+					key = (request.root_url, request.path, tuple(sorted(request.args.items(multi=True))))
+					entry = self.get(key, versions)
+					if entry is None:
+						res = handler(*args, **kwargs)
+						if not isinstance(res, Response) or res.status_code != 200:
+							return res
+						entry = CacheEntry(b"", res.status_code, res.content_type, versions)
+						if res.is_streamed:
+							res.response = self.record(key, entry, res.response)
+						else:
+							entry.body = res.get_data()
+							self.put(key, entry)
+						res.headers.set("X-Cache", "MISS")
+					else:
+						res = entry.to_response()
+						res.headers.set("X-Cache", "HIT")
+				res.set_etag(etag)
+				res.headers.set("Cache-Control", cache_control)
+				return res
+			return wrapper
+		return decorator
+
+
+response_cache = ResponseCache(db.get_versions, int(environ.get("APP_RESPONSE_CACHE_SIZE", 32_000_000)))
@@ -0,0 +1,4 @@
+def worker_exit(server, worker):
+	# Scores waiting in the write-behind queue are written before the worker process ends
+	from score_writer import score_writer
+	score_writer.close()
@@ -0,0 +1,106 @@
+from base64 import b64decode, b64encode
+from binascii import Error as Base64Error
+from hashlib import sha256
+from os import environ, makedirs, path, replace, listdir, remove
+from re import fullmatch
+from tempfile import NamedTemporaryFile
+from typing import Any, Optional, Iterable
+
+from flask import url_for
+
+from pyjson import JsonType
+
+image_extensions = {"image/png": "png", "image/jpeg": "jpg", "image/gif": "gif", "image/webp": "webp"}
+image_mimetypes = {extension: mimetype for mimetype, extension in image_extensions.items()}
+data_url_pattern = r"data:(image/[\w.+-]+);base64,(.*)"
+image_name_pattern = r"([0-9a-f]{64})\.(\w+)"
+
+
+class ImageStore:
+	def __init__(self, directory: str = "images", base_url: str = None):
+		self.directory = directory
+		self.base_url = base_url.rstrip("/") if base_url else None
+		makedirs(directory, exist_ok=True)
+
+	@staticmethod
+	def is_valid_name(name: str) -> bool:
+		match = fullmatch(image_name_pattern, name)
+		return match is not None and match[2] in image_mimetypes
+
+	def get_path(self, name: str) -> str:
+		return path.join(self.directory, name)
+
+	def exists(self, name: str) -> bool:
+		return self.is_valid_name(name) and path.isfile(self.get_path(name))
+
+	def save(self, content: bytes, mimetype: str, created: set[str] = None) -> str:
+		extension = image_extensions.get(mimetype)
+		if extension is None:
+			raise ValueError(f"Unsupported image type: {mimetype}")
+		name = f"{sha256(content).hexdigest()}.{extension}"
+		if not path.isfile(self.get_path(name)):
+			# Written aside then renamed, so a concurrent reader never sees a partial file
+			with NamedTemporaryFile(dir=self.directory, delete=False) as file:
+				file.write(content)
+			replace(file.name, self.get_path(name))
+			if created is not None:
+				created.add(name)
+		return name
+
+	def save_data_url(self, data_url: str, created: set[str] = None) -> str:
+		match = fullmatch(data_url_pattern, data_url)
+		if match is None:
+			raise ValueError("Invalid image data URL")
+		try:
+			content = b64decode(match[2], validate=True)
+		except Base64Error as e:
+			raise ValueError(f"Invalid image data: {e}")
+		return self.save(content, match[1], created)
+
+	def resolve(self, image: Optional[str], created: set[str] = None) -> Optional[str]:
+		# The names of the files written are added to created, so they can be removed if the question is not saved
+		if not image:
+			return None
+		if image.startswith("data:"):
+			return self.save_data_url(image, created)
+		name = image.rsplit("/", 1)[-1]
+		if not self.exists(name):
+			raise ValueError(f"Unknown image: {image}")
+		return name
+
+	def delete(self, name: str):
+		try:
+			remove(self.get_path(name))
+		except FileNotFoundError:
+			pass
+
+	def sweep(self, used: Iterable[str]) -> int:
+		# Removes the images no question refers to anymore, other files of the directory are left untouched
+		used = set(used)
+		unused = [name for name in listdir(self.directory) if self.is_valid_name(name) and name not in used]
+		for name in unused:
+			self.delete(name)
+		return len(unused)
+
+	def get_data_url(self, name: str) -> str:
+		with open(self.get_path(name), "rb") as file:
+			return f"data:{image_mimetypes[name.rsplit('.', 1)[1]]};base64,{b64encode(file.read()).decode('ascii')}"
+
+	def get_url(self, name: str) -> str:
+		# Absolute, as the UI is served from another origin, the trusted proxy headers give the public host and path prefix
+		if self.base_url is not None:
+			return f"{self.base_url}/{name}"
+		return url_for("get_image", name=name, _external=True)
+
+
+class ImageUrlJsonType(JsonType[Optional[str]]):
+	def serialize(self, value: Optional[str]) -> Any:
+		if value is None or value.startswith("data:"):
+			return value
+		return image_store.get_url(value)
+
+	def deserialize(self, value: Any) -> Optional[str]:
+		return None if value is None else str(value)
+
+
+image_store = ImageStore(environ.get("APP_IMAGES_DIR", "images"), environ.get("APP_IMAGES_BASE_URL"))
@@ -0,0 +1,78 @@
+from bisect import bisect_left, bisect_right
+from os import register_at_fork
+from threading import Lock
+from typing import Optional
+
+from models import db, Score, scores_reset
+
+
+class Leaderboard:
+	def __init__(self):
+		self._lock = Lock()
+		self.clear()
+
+	def clear(self):
+		# Loaded again from the scores table on the next read
+		with self._lock:
+			self.versions: Optional[tuple[int, int]] = None
+			self.keys: list[tuple[int, int]] = []
+			self.scores: list[Score] = []
+			self.ids: set[int] = set()
+			self.max_id = 0
+
+	def reset_after_fork(self):
+		self._lock = Lock()
+		self.clear()
+
+	@staticmethod
+	def get_key(score: Score) -> tuple[int, float]:
+		# Same order as the SQL leaderboard (score descending, then id), scores not saved yet come after their ties
+		return -score.score, score.__dict__.get("id") or float("inf")
+
+	@staticmethod
+	def get_versions() -> tuple[int, int]:
+		return db.get_versions(scores_reset, Score.__table__.name)
+
+	def sync(self):
+		# Scores are written by every worker, the shared versions tell when this copy is outdated
+		# Read before the scores, so a concurrent write leaves this copy outdated until the next read instead of stale
+		versions = self.get_versions()
+		if self.versions is None or self.versions[0] != versions[0]:
+			scores = Score.list(None, [("score", True), "id"])
+			self.keys = [self.get_key(score) for score in scores]
+			self.scores = scores
+			self.ids = {score.id for score in scores}
+			self.max_id = max(self.ids, default=0)
+		elif self.versions[1] != versions[1]:
+			# Writes are serialized by SQLite, so scores are committed in the order of their ids and only new ones are read
+			for score in Score.list("id > :id", "id", id=self.max_id):
+				key = self.get_key(score)
+				i = bisect_left(self.keys, key)
+				self.keys.insert(i, key)
+				self.scores.insert(i, score)
+				self.ids.add(score.id)
+				self.max_id = score.id
+		self.versions = versions
+
+	def get_standing(self, score: Score, limit: int) -> tuple[int, list[Score]]:
+		with self._lock:
+			self.sync()
+			rank = bisect_left(self.keys, self.get_key(score)) + 1
+			top = self.scores[:limit]
+			pending = score.__dict__.get("id") not in self.ids
+		if pending and rank <= limit:
+			# Not written yet by the write-behind queue, the player still sees their own score
+			top = (top[:rank - 1] + [score] + top[rank - 1:])[:limit]
+		return rank, top
+
+	def get_page(self, limit: int, cursor: Optional[tuple[int, int]] = None) -> tuple[list[Score], Optional[str]]:
+		with self._lock:
+			self.sync()
+			start = bisect_right(self.keys, (-cursor[0], cursor[1])) if cursor else 0
+			scores = self.scores[start:start + limit]
+			has_more = start + limit < len(self.scores)
+		return scores, scores[-1].get_cursor() if has_more else None
+
+
+leaderboard = Leaderboard()
+register_at_fork(after_in_child=leaderboard.reset_after_fork)
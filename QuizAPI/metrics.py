@@ -0,0 +1,264 @@
+from atexit import register as at_exit
+from bisect import bisect_left
+from json import dump, load
+from os import environ, getpid, listdir, makedirs, path, register_at_fork, replace
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Iterable, Iterator, Callable, Optional
+
+from flask import Flask, Response, g, request
+
+from models import db
+from pysql import QueryListener, get_statement_shape
+
+duration_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+size_buckets = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def escape_label_value(value: str) -> str:
+	return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(label_names: Iterable[str], labels: Iterable[str], extra: str = None) -> str:
+	pairs = [f"{name}=\"{escape_label_value(value)}\"" for name, value in zip(label_names, labels)]
+	if extra:
+		pairs.append(extra)
+	return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+	type_ = "untyped"
+
+	def __init__(self, name: str, description: str, label_names: tuple[str, ...]):
+		self.name = name
+		self.description = description
+		self.label_names = label_names
+		self.values = {}
+
+	def to_dict(self) -> dict:
+		return {"type": self.type_, "description": self.description, "label_names": self.label_names, "values": [[list(labels), value] for labels, value in self.values.items()]}
+
+	def merge(self, values: Iterable[tuple[tuple[str, ...], object]]):
+		raise NotImplementedError(f"The class {type(self).__name__} does not provide an implementation to merge values")
+
+	def export(self) -> Iterator[str]:
+		yield f"# HELP {self.name} {self.description}"
+		yield f"# TYPE {self.name} {self.type_}"
+
+
+class CounterMetric(Metric):
+	type_ = "counter"
+
+	def inc(self, labels: tuple[str, ...], amount: float = 1):
+		self.values[labels] = self.values.get(labels, 0) + amount
+
+	def merge(self, values: Iterable[tuple[tuple[str, ...], float]]):
+		for labels, value in values:
+			self.inc(labels, value)
+
+	def export(self) -> Iterator[str]:
+		yield from super().export()
+		for labels, value in self.values.items():
+			yield f"{self.name}{format_labels(self.label_names, labels)} {value}"
+
+
+class HistogramMetric(Metric):
+	type_ = "histogram"
+
+	def __init__(self, name: str, description: str, label_names: tuple[str, ...], buckets: tuple[float, ...]):
+		super().__init__(name, description, label_names)
+		self.buckets = buckets
+
+	def observe(self, labels: tuple[str, ...], value: float):
+		# Stored as [non-cumulative bucket counts..., +Inf count, sum]
+		counts = self.values.get(labels)
+		if counts is None:
+			counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+		counts[bisect_left(self.buckets, value)] += 1
+		counts[-1] += value
+
+	def merge(self, values: Iterable[tuple[tuple[str, ...], list]]):
+		for labels, other in values:
+			counts = self.values.get(labels)
+			if counts is None:
+				counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+			for i, value in enumerate(other):
+				counts[i] += value
+
+	def export(self) -> Iterator[str]:
+		yield from super().export()
+		for labels, counts in self.values.items():
+			cumulative = 0
+			for bucket, count in zip(self.buckets + ("+Inf",), counts):
+				cumulative += count
+				le = f"le=\"{bucket}\""
+				yield f"{self.name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}"
+			yield f"{self.name}_sum{format_labels(self.label_names, labels)} {counts[-1]}"
+			yield f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}"
+
+
+class MetricsRegistry:
+	def __init__(self):
+		self.metrics: dict[str, Metric] = {}
+		self.lock = Lock()
+
+	def counter(self, name: str, description: str, *label_names: str) -> CounterMetric:
+		metric = self.metrics[name] = CounterMetric(name, description, label_names)
+		return metric
+
+	def histogram(self, name: str, description: str, *label_names: str, buckets: tuple[float, ...] = duration_buckets) -> HistogramMetric:
+		metric = self.metrics[name] = HistogramMetric(name, description, label_names, buckets)
+		return metric
+
+	def to_dict(self) -> dict[str, dict]:
+		with self.lock:
+			return {name: metric.to_dict() for name, metric in self.metrics.items()}
+
+	def merge(self, snapshot: dict[str, dict]):
+		with self.lock:
+			for name, data in snapshot.items():
+				metric = self.metrics.get(name)
+				if metric is not None:
+					metric.merge((tuple(labels), value) for labels, value in data["values"])
+
+	def export(self) -> str:
+		with self.lock:
+			return "\n".join(line for metric in self.metrics.values() for line in metric.export()) + "\n"
+
+
+class AppMetrics(QueryListener):
+	def __init__(self, directory: str = None, flush_interval: float = 5.0):
+		self.directory = directory
+		self.flush_interval = flush_interval
+		self.last_flush = monotonic()
+		self.registry = self.create_registry()
+		if directory:
+			makedirs(directory, exist_ok=True)
+			at_exit(self.flush)
+
+	@staticmethod
+	def create_registry() -> MetricsRegistry:
+		registry = MetricsRegistry()
+		registry.histogram("pysql_query_duration_seconds", "Execution time of SQL statements, excluding the time spent waiting for the execution lock", "statement")
+		registry.histogram("pysql_lock_wait_seconds", "Time spent waiting for the SQL execution lock before executing a statement", "statement")
+		registry.histogram("pysql_fetch_duration_seconds", "Time spent fetching and binding the rows returned by SQL statements", "statement")
+		registry.counter("pysql_rows_returned_total", "Rows returned by SQL statements", "statement")
+		registry.counter("pysql_rows_affected_total", "Rows inserted, updated or deleted by SQL statements", "statement")
+		registry.histogram("http_request_duration_seconds", "Duration of HTTP requests, until the response body is fully sent", "method", "endpoint", "status")
+		registry.histogram("http_request_size_bytes", "Size of HTTP request bodies", "method", "endpoint", buckets=size_buckets)
+		registry.histogram("http_response_size_bytes", "Size of HTTP response bodies", "method", "endpoint", "status", buckets=size_buckets)
+		registry.counter("response_cache_requests_total", "Requests to cached routes, by result (hit, miss or not_modified for a matching ETag)", "result")
+		registry.counter("score_writer_dropped_scores_total", "Scores dropped by the write-behind queue after failing to write them")
+		return registry
+
+	def reset_after_fork(self):
+		# A forked worker must not report again what was recorded by its parent before the fork
+		self.registry = self.create_registry()
+		self.last_flush = monotonic()
+
+	def get(self, name: str):
+		return self.registry.metrics[name]
+
+	def query_executed(self, sql: str, lock_wait: float, duration: float, rows_affected: int):
+		labels = (get_statement_shape(sql),)
+		with self.registry.lock:
+			self.get("pysql_query_duration_seconds").observe(labels, duration)
+			self.get("pysql_lock_wait_seconds").observe(labels, lock_wait)
+			if rows_affected:
+				self.get("pysql_rows_affected_total").inc(labels, rows_affected)
+		self.flush_if_needed()
+
+	def rows_fetched(self, sql: str, rows: int, duration: float):
+		labels = (get_statement_shape(sql),)
+		with self.registry.lock:
+			self.get("pysql_fetch_duration_seconds").observe(labels, duration)
+			self.get("pysql_rows_returned_total").inc(labels, rows)
+
+	def record_request(self, method: str, endpoint: str, status: int, duration: float, request_size: int, response_size: int):
+		status = str(status)
+		with self.registry.lock:
+			self.get("http_request_duration_seconds").observe((method, endpoint, status), duration)
+			self.get("http_request_size_bytes").observe((method, endpoint), request_size)
+			self.get("http_response_size_bytes").observe((method, endpoint, status), response_size)
+		self.flush_if_needed()
+
+	def record_response_cache(self, result: str):
+		with self.registry.lock:
+			self.get("response_cache_requests_total").inc((result,))
+		self.flush_if_needed()
+
+	def record_dropped_scores(self, count: int):
+		with self.registry.lock:
+			self.get("score_writer_dropped_scores_total").inc((), count)
+		self.flush_if_needed()
+
+	def install(self, app: Flask):
+		app.before_request(self.start_request)
+		app.after_request(self.end_request)
+
+	@staticmethod
+	def start_request():
+		g.metrics_start = perf_counter()
+
+	def end_request(self, response: Response) -> Response:
+		start = g.pop("metrics_start", None)
+		if start is None:
+			return response
+		method, status = request.method, response.status_code
+		endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+		request_size = request.content_length or 0
+
+		def record(response_size: int):
+			self.record_request(method, endpoint, status, perf_counter() - start, request_size, response_size)
+
+		if response.is_streamed and response.content_length is None:
+			response.response = self.count_stream(response.response, record)
+		else:
+			record(response.content_length or 0)
+		return response
+
+	@staticmethod
+	def count_stream(chunks: Iterable[bytes], record: Callable[[int], None]) -> Iterator[bytes]:
+		size = 0
+		try:
+			for chunk in chunks:
+				size += len(chunk)
+				yield chunk
+		finally:
+			if hasattr(chunks, "close"):
+				chunks.close()
+			record(size)
+
+	def get_file(self, pid: int = None) -> Optional[str]:
+		return path.join(self.directory, f"metrics-{pid or getpid()}.json") if self.directory else None
+
+	def flush_if_needed(self):
+		if self.directory and monotonic() - self.last_flush > self.flush_interval:
+			self.flush()
+
+	def flush(self):
+		# Each process writes its own snapshot, the exporter merges the snapshots of all the processes
+		self.last_flush = monotonic()
+		with NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as file:
+			dump(self.registry.to_dict(), file)
+		replace(file.name, self.get_file())
+
+	def export(self) -> str:
+		if not self.directory:
+			return self.registry.export()
+		self.flush()
+		registry = self.create_registry()
+		for name in listdir(self.directory):
+			if name.startswith("metrics-") and name.endswith(".json"):
+				try:
+					with open(path.join(self.directory, name)) as file:
+						registry.merge(load(file))
+				except (OSError, ValueError):
+					continue
+		return registry.export()
+
+
+app_metrics = AppMetrics(environ.get("APP_METRICS_DIR"), float(environ.get("APP_METRICS_FLUSH_INTERVAL", 5)))
+db.add_listener(app_metrics)
+register_at_fork(after_in_child=app_metrics.reset_after_fork)
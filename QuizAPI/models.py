@@ -1,12 +1,21 @@
 from os import environ
+from threading import Lock, Thread
+from typing import Optional, Iterator
 
+from images import image_store, ImageUrlJsonType
 from pyjson import JsonBindings, JsonModel, Nullable
-from pysql import Database, DatabaseModel, Column, Primary, Foreign, Delete
+from pysql import Database, DatabaseModel, Column, Primary, Foreign, Select, Update, Delete, Index, OrderBy, order_select, placeholder
 
 debug = int(environ.get("FLASK_DEBUG")) != 0
-db = Database("quiz.db", auto_create_tables=True, debug=debug)
+db = Database("quiz.db", auto_create_tables=True, debug=debug, connection_per_thread=True, journal_mode="WAL", busy_timeout=float(environ.get("APP_DB_BUSY_TIMEOUT", 5)), shared_versions=True)
 json = JsonBindings(indent=2 if debug else None)
 
+sort_key_spacing = 1024.0
+sort_key_min_gap = 1e-6
+question_order: OrderBy = ["sort_key", "id"]
+# Version touched when all the scores are deleted, not a table
+scores_reset = "scores_reset"
+
 
 @json.model(error=bool, message=str, code=int)
 class APIError(Exception, JsonModel):
@@ -29,7 +38,7 @@ class APIError(Exception, JsonModel):
 		return APIError(repr(error) if debug else "An exception occurred during the handling of your request. Please try again later!", 500)
 
 
-@db.model("answer", Column("id", int, Primary(True)), Column("text", str), Column("is_correct", bool), Column("question", int, Foreign("questions", "id")))
+@db.model("answer", Column("id", int, Primary(True)), Column("text", str), Column("is_correct", bool), Column("question", int, Foreign("questions", "id")), Index("question"))
 @json.model(id=Nullable(int), text=str, is_correct=(bool, "isCorrect"))
 class Answer(DatabaseModel, JsonModel):
 	id: int
@@ -44,8 +53,8 @@ class Answer(DatabaseModel, JsonModel):
 			raise APIError("Missing answer text")
 
 
-@db.model("questions", Column("id", int, Primary(True)), Column("text", str), Column("title", str), Column("image", str), Column("position", int))
-@json.model(id=Nullable(int), text=str, title=str, image=Nullable(str), position=int, possible_answers=([Answer, ...], "possibleAnswers"))
+@db.model("questions", Column("id", int, Primary(True)), Column("text", str), Column("title", str), Column("image", str), Column("sort_key", float), Index("sort_key"), Index("image"))
+@json.model(id=Nullable(int), text=str, title=str, image=ImageUrlJsonType(), position=int, possible_answers=([Answer, ...], "possibleAnswers"))
 class Question(DatabaseModel, JsonModel):
 	id: int
 
@@ -57,6 +66,11 @@ class Question(DatabaseModel, JsonModel):
 		self.possible_answers = possible_answers
 
 	def validate(self):
+		self.validate_content()
+		if self.position <= 0 or self.position > Question.count() + 1:
+			raise APIError("Invalid question position")
+
+	def validate_content(self):
 		if not self.text:
 			raise APIError("Missing question text")
 		if not self.title:
@@ -70,13 +84,186 @@ class Question(DatabaseModel, JsonModel):
 				correct_count += 1
 		if correct_count != 1:
 			raise APIError("There should be one and only one correct answer to the question")
-		if self.position <= 0 or self.position > Question.count() + 1:
-			raise APIError("Invalid question position")
+
+	def store_image(self, created: set[str] = None):
+		try:
+			self.image = image_store.resolve(self.image, created)
+		except ValueError as e:
+			raise APIError(f"Invalid question image: {e}")
+
+	@staticmethod
+	def release_image(image: Optional[str]):
+		# Called in the write transaction, so no other question can start using the image before it is removed
+		if image and not Question.count("image = :image", image=image):
+			image_store.delete(image)
+
+	@staticmethod
+	def get_images() -> list[str]:
+		cur = db.execute(Select().column("image").distinct().from_table(Question.__table__.name).where("image IS NOT NULL").build_sql())
+		images = [image for image, in cur.fetchall()]
+		cur.close()
+		return images
+
+	@staticmethod
+	def sweep_images() -> int:
+		return image_store.sweep(Question.get_images())
+
+	@staticmethod
+	def migrate_images():
+		# Images were stored as data URLs in the questions table before being saved as files
+		for question in Question.list("image LIKE 'data:%'"):
+			try:
+				question.image = image_store.save_data_url(question.image)
+			except ValueError as e:
+				print(f"Dropping invalid image of question #{question.id}: {e}")
+				question.image = None
+			question.save()
 
 	def with_answers(self) -> "Question":
 		self.possible_answers = Answer.list("question = :id", id=self.id)
 		return self
 
+	def with_position(self) -> "Question":
+		self.position = question_ranks.get().get_position(self.id)
+		return self
+
+	@staticmethod
+	def get_at(position: int) -> Optional["Question"]:
+		question_id = question_ranks.get().get_id(position)
+		question = Question.get(id=question_id) if question_id is not None else None
+		return question.with_position() if question else None
+
+	@staticmethod
+	def iter_with_answers(batch_size: int = 100) -> Iterator["Question"]:
+		position = 0
+		for questions in Question.iter_batches(None, question_order, batch_size):
+			for question in Answer.prefetch(questions, "possible_answers"):
+				position += 1
+				question.position = position
+				yield question
+
+	@staticmethod
+	def list_with_answers() -> list["Question"]:
+		return list(Question.iter_with_answers())
+
+	@staticmethod
+	def get_neighbour_sort_keys(position: int, exclude_id: int = None) -> tuple[Optional[float], Optional[float]]:
+		select = Select().column("sort_key").from_table(Question.__table__.name).where("id IS NOT :id").with_limit(2 if position > 1 else 1).with_offset(max(position - 2, 0))
+		cur = db.execute(order_select(select, question_order).build_sql(), id=exclude_id)
+		keys = [sort_key for sort_key, in cur.fetchall()]
+		cur.close()
+		if position > 1 and not keys:
+			# Past the end of the other questions (e.g. moved to the last position), the question goes after the last one
+			select = Select().column("sort_key").from_table(Question.__table__.name).where("id IS NOT :id").with_limit(1)
+			cur = db.execute(order_select(select, [(column, True) for column in question_order]).build_sql(), id=exclude_id)
+			keys = [sort_key for sort_key, in cur.fetchall()]
+			cur.close()
+		if position <= 1:
+			return None, keys[0] if keys else None
+		return keys[0] if keys else None, keys[1] if len(keys) > 1 else None
+
+	def place_at(self, position: int, previous: "Question" = None):
+		# Only the placed question is written, it takes a key between the keys of its new neighbours
+		before, after = Question.get_neighbour_sort_keys(position, previous.id if previous else None)
+		if previous and (before is None or before < previous.sort_key) and (after is None or previous.sort_key < after):
+			self.sort_key = previous.sort_key
+		elif before is None:
+			self.sort_key = after - sort_key_spacing if after is not None else sort_key_spacing
+		elif after is None:
+			self.sort_key = before + sort_key_spacing
+		else:
+			self.sort_key = (before + after) / 2
+			if not before < self.sort_key < after:
+				# The float precision between the two keys is exhausted, so the keys are spread again right away
+				Question.renumber_sort_keys()
+				self.place_at(position, Question.get(id=previous.id) if previous else None)
+			elif after - before < sort_key_min_gap:
+				Question.schedule_renumbering()
+
+	@staticmethod
+	def check_positions(questions: list["Question"], count: int = None):
+		# Each position is checked against the questions already there and the ones added before it
+		count = Question.count() if count is None else count
+		for i, question in enumerate(questions):
+			if question.position <= 0 or question.position > count + i + 1:
+				raise APIError(f"Invalid position {question.position} for question #{i + 1}")
+
+	@staticmethod
+	def add_all(questions: list["Question"]):
+		# Same result as inserting the questions one by one, but the keys are computed in memory and the rows written in batches
+		cur = db.execute(order_select(Select().column("sort_key").from_table(Question.__table__.name), question_order).build_sql())
+		order: list = [sort_key for sort_key, in cur.fetchall()]
+		cur.close()
+		Question.check_positions(questions, len(order))
+		for question in questions:
+			order.insert(question.position - 1, question)
+		if not Question.spread_sort_keys(order):
+			Question.renumber_sort_keys()
+			rank = 0
+			for i, item in enumerate(order):
+				if not isinstance(item, Question):
+					rank += 1
+					order[i] = rank * sort_key_spacing
+			Question.spread_sort_keys(order)
+		Question.add_many(questions, "id")
+		answers = []
+		for question in questions:
+			for answer in question.possible_answers:
+				answer.question = question.id
+				answers.append(answer)
+		Answer.add_many(answers, "id")
+
+	@staticmethod
+	def spread_sort_keys(order: list) -> bool:
+		# Each run of new questions is spread evenly between the keys of the existing questions around it
+		before, run = None, []
+		for item in order + [None]:
+			if isinstance(item, Question):
+				run.append(item)
+				continue
+			if run:
+				if before is None and item is None:
+					keys = [sort_key_spacing * (i + 1) for i in range(len(run))]
+				elif before is None:
+					keys = [item - sort_key_spacing * (len(run) - i) for i in range(len(run))]
+				elif item is None:
+					keys = [before + sort_key_spacing * (i + 1) for i in range(len(run))]
+				else:
+					step = (item - before) / (len(run) + 1)
+					keys = [before + step * (i + 1) for i in range(len(run))]
+				bounds = [key for key in (before, *keys, item) if key is not None]
+				if any(a >= b for a, b in zip(bounds, bounds[1:])):
+					return False
+				for question, key in zip(run, keys):
+					question.sort_key = key
+				run = []
+			before = item
+		return True
+
+	@staticmethod
+	def renumber_sort_keys():
+		with db.transaction():
+			cur = db.execute(order_select(Select().column("id").from_table(Question.__table__.name), question_order).build_sql())
+			ids = [question_id for question_id, in cur.fetchall()]
+			cur.close()
+			update = Update(Question.__table__.name).set("sort_key", placeholder("sort_key")).where("id = :id").build_sql()
+			db.execute_many(update, ({"id": question_id, "sort_key": rank * sort_key_spacing} for rank, question_id in enumerate(ids, 1)))
+
+	@staticmethod
+	def schedule_renumbering():
+		# Renumbered once the current transaction is released, the order is unchanged so it can be done anytime
+		if renumbering_lock.acquire(False):
+			Thread(target=Question.renumber_in_background, daemon=True).start()
+
+	@staticmethod
+	def renumber_in_background():
+		try:
+			Question.renumber_sort_keys()
+		except Exception as e:
+			print(f"Failed to renumber question sort keys: {e!r}")
+		finally:
+			renumbering_lock.release()
+
 	def delete_answers(self):
 		db.execute(Delete(Answer.__table__.name).where("question = :id").build_sql(), id=self.id).close()
 
@@ -85,7 +272,48 @@ class Question(DatabaseModel, JsonModel):
 			self.delete_answers()
 		for answer in self.possible_answers:
 			answer.question = self.id
-			answer.add("id")
+		Answer.add_many(self.possible_answers, "id")
+
+
+class QuestionRanks:
+	def __init__(self, version: tuple[int, ...], question_ids: list[int]):
+		self.version = version
+		self.question_ids = question_ids
+		self.positions = {question_id: position for position, question_id in enumerate(question_ids, 1)}
+
+	def get_position(self, question_id: int) -> Optional[int]:
+		return self.positions.get(question_id)
+
+	def get_id(self, position: int) -> Optional[int]:
+		return self.question_ids[position - 1] if 0 < position <= len(self.question_ids) else None
+
+
+class QuestionRanksCache:
+	def __init__(self):
+		self.ranks = None
+		self._lock = Lock()
+
+	@staticmethod
+	def get_version() -> tuple[int, ...]:
+		return db.get_versions(Question.__table__.name)
+
+	def get(self) -> QuestionRanks:
+		ranks = self.ranks
+		if ranks is not None and ranks.version == self.get_version():
+			return ranks
+		with self._lock:
+			version = self.get_version()
+			if self.ranks is None or self.ranks.version != version:
+				cur = db.execute(order_select(Select().column("id").from_table(Question.__table__.name), question_order).build_sql())
+				self.ranks = QuestionRanks(version, [question_id for question_id, in cur.fetchall()])
+				cur.close()
+			return self.ranks
+
+
+question_ranks = QuestionRanksCache()
+renumbering_lock = Lock()
+db.rename_column("questions", "position", "sort_key")
+db.add_migration_hook(Question.migrate_images)
 
 
 @json.model(id=int)
@@ -94,20 +322,34 @@ class QuestionId(JsonModel):
 		self.id = id_
 
 
-@db.model("scores", Column("id", int, Primary(True)), Column("player_name", str), Column("score", int), Column("date", str))
+@db.model("scores", Column("id", int, Primary(True)), Column("player_name", str), Column("score", int), Column("date", str), Index(("score", True)))
 @json.model(player_name=(str, "playerName"), score=int, date=str)
 class Score(DatabaseModel, JsonModel):
+	id: int
+
 	def __init__(self, player_name: str, score: int, date: str):
 		self.player_name = player_name
 		self.score = score
 		self.date = date
 
+	def get_cursor(self) -> str:
+		return f"{self.score}_{self.id}"
+
+	@staticmethod
+	def parse_cursor(cursor: str) -> tuple[int, int]:
+		try:
+			score, id_ = cursor.split("_")
+			return int(score), int(id_)
+		except ValueError:
+			raise APIError(f"Invalid leaderboard cursor: {cursor}")
+
 
-@json.model(size=int, scores=[Score, ...])
+@json.model(size=int, scores=[Score, ...], next_cursor=(Nullable(str), "nextCursor"))
 class QuizInfo(JsonModel):
-	def __init__(self, size: int, *scores: Score):
+	def __init__(self, size: int, *scores: Score, next_cursor: str = None):
 		self.size = size
 		self.scores = scores
+		self.next_cursor = next_cursor
 
 
 @json.model(password=str)
@@ -142,9 +384,11 @@ class AnswerSummary(JsonModel):
 		self.was_correct = was_correct
 
 
-@json.model(player_name=(str, "playerName"), score=int, answers_summaries=([AnswerSummary, ...], "answersSummaries"))
+@json.model(player_name=(str, "playerName"), score=int, answers_summaries=([AnswerSummary, ...], "answersSummaries"), rank=int, top_scores=([Score, ...], "topScores"))
 class ParticipationResponse(JsonModel):
-	def __init__(self, score: Score, answers_summaries: list[AnswerSummary]):
+	def __init__(self, score: Score, answers_summaries: list[AnswerSummary], rank: int, top_scores: list[Score]):
 		self.player_name = score.player_name
 		self.score = score.score
 		self.answers_summaries = answers_summaries
+		self.rank = rank
+		self.top_scores = top_scores
@@ -1,3 +1,4 @@
+from .backends import *
 from .bindings import *
 from .json_types import *
 from .utils import *
@@ -0,0 +1,47 @@
+from abc import ABCMeta, abstractmethod
+from json import dumps, loads
+from typing import Any, Union
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+
+class JsonBackend(metaclass=ABCMeta):
+	@abstractmethod
+	def dumps(self, value: Any, indent: int = None) -> bytes:
+		raise NotImplementedError(f"The class {type(self).__name__} does not provide an implementation to encode JSON")
+
+	@abstractmethod
+	def loads(self, data: Union[bytes, str]) -> Any:
+		raise NotImplementedError(f"The class {type(self).__name__} does not provide an implementation to decode JSON")
+
+
+class StdlibJsonBackend(JsonBackend):
+	def dumps(self, value: Any, indent: int = None) -> bytes:
+		return dumps(value, indent=indent).encode("UTF-8")
+
+	def loads(self, data: Union[bytes, str]) -> Any:
+		return loads(data)
+
+
+class OrjsonBackend(JsonBackend):
+	def __init__(self):
+		if orjson is None:
+			raise RuntimeError("The orjson JSON backend requires the orjson package to be installed")
+		self.fallback = StdlibJsonBackend()
+
+	def dumps(self, value: Any, indent: int = None) -> bytes:
+		if indent is None:
+			return orjson.dumps(value)
+		if indent == 2:
+			return orjson.dumps(value, option=orjson.OPT_INDENT_2)
+		return self.fallback.dumps(value, indent)
+
+	def loads(self, data: Union[bytes, str]) -> Any:
+		return orjson.loads(data)
+
+
+def default_json_backend() -> JsonBackend:
+	return StdlibJsonBackend() if orjson is None else OrjsonBackend()
@@ -1,6 +1,7 @@
-from json import dumps, loads
-from typing import TypeVar, Protocol, Any, TYPE_CHECKING
+from typing import TypeVar, Protocol, Any, TYPE_CHECKING, Union, Iterable, Iterator
 
+from .backends import JsonBackend, default_json_backend
+from .compiler import SchemaCompiler
 from .json_types import json_field_type
 
 if TYPE_CHECKING:
@@ -23,9 +24,10 @@ class Schema:
 
 
 class JsonBindings:
-	def __init__(self, indent: int = None):
+	def __init__(self, indent: int = None, backend: JsonBackend = None):
 		self.schemas = {}
 		self.indent = indent
+		self.backend = backend or default_json_backend()
 
 	def get_schema(self, python_class: type):
 		return self.schemas[python_class]
@@ -48,36 +50,63 @@ class JsonBindings:
 			self.schemas[BaseClass] = schema = Schema(BaseClass, *fields)
 
 			def to_json(this: BaseClass) -> str:
-				return dumps(this.to_dict(), indent=self.indent)
+				return this.to_json_bytes().decode("UTF-8")
 
-			def from_json(json_string: str) -> BaseClass:
-				return BaseClass.from_dict(loads(json_string))
+			def to_json_bytes(this: BaseClass) -> bytes:
+				return self.backend.dumps(this.to_dict(), self.indent)
 
-			def to_json_list(*values: BaseClass) -> str:
-				return dumps([value.to_dict() for value in values], indent=self.indent)
-
-			def from_json_list(json_string: str) -> list[BaseClass]:
-				return [BaseClass.from_dict(elem) for elem in loads(json_string)]
+			def from_json(json_string: Union[str, bytes]) -> BaseClass:
+				return BaseClass.from_dict(self.backend.loads(json_string))
 
-			def to_dict(this: BaseClass) -> dict[str, Any]:
-				values = {}
-				for field in schema.fields:
-					values[field.json_name] = field.json_type.serialize(this.__dict__.get(field.python_name))
-				return values
-
-			def from_dict(values: dict[str, Any]) -> BaseClass:
-				# noinspection PyArgumentList
-				this = BaseClass.__new__(BaseClass)
-				for field in schema.fields:
-					this.__dict__[field.python_name] = field.json_type.deserialize(values.get(field.json_name))
-				return this
+			def to_json_list(*values: BaseClass) -> str:
+				return BaseClass.to_json_list_bytes(*values).decode("UTF-8")
+
+			def to_json_list_bytes(*values: BaseClass) -> bytes:
+				return self.backend.dumps([value.to_dict() for value in values], self.indent)
+
+			def iter_json_list(values: Iterable[BaseClass]) -> Iterator[bytes]:
+				# Punctuation taken from the backend, so the stream has the same bytes as to_json_list_bytes
+				start, separator, end = self.backend.dumps([0, 0], self.indent).split(b"0")
+				# Elements are nested one level deeper inside the list
+				padding = None if self.indent is None else b"\n" + start.rsplit(b"\n", 1)[-1]
+				first = True
+				for value in values:
+					element = self.backend.dumps(value.to_dict(), self.indent)
+					if padding is not None:
+						element = element.replace(b"\n", padding)
+					yield (start if first else separator) + element
+					first = False
+				yield self.backend.dumps([], self.indent) if first else end
+
+			def from_json_list(json_string: Union[str, bytes]) -> list[BaseClass]:
+				return [BaseClass.from_dict(elem) for elem in self.backend.loads(json_string)]
+
+			def iter_json_lines(values: Iterable[BaseClass]) -> Iterator[bytes]:
+				# Newline delimited JSON needs one document per line, so it is never indented
+				for value in values:
+					yield self.backend.dumps(value.to_dict()) + b"\n"
+
+			def from_json_lines(json_lines: Union[str, bytes, Iterable[Union[str, bytes]]]) -> list[BaseClass]:
+				# Also accepts the lines one by one (e.g. a file or a stream), so the whole document is never held in memory
+				lines = json_lines.splitlines() if isinstance(json_lines, (str, bytes)) else json_lines
+				return [BaseClass.from_dict(self.backend.loads(line)) for line in lines if line.strip()]
+
+			# Specialized for the schema fields, avoiding a JsonType dispatch per field and per value
+			compiler = SchemaCompiler(schema)
+			to_dict = compiler.compile_to_dict()
+			from_dict = compiler.compile_from_dict()
 
 			setattr(BaseClass, "__json__", self)
 			setattr(BaseClass, "__schema__", schema)
 			setattr(BaseClass, "to_json", to_json)
+			setattr(BaseClass, "to_json_bytes", to_json_bytes)
 			setattr(BaseClass, "from_json", staticmethod(from_json))
 			setattr(BaseClass, "to_json_list", staticmethod(to_json_list))
+			setattr(BaseClass, "to_json_list_bytes", staticmethod(to_json_list_bytes))
+			setattr(BaseClass, "iter_json_list", staticmethod(iter_json_list))
 			setattr(BaseClass, "from_json_list", staticmethod(from_json_list))
+			setattr(BaseClass, "iter_json_lines", staticmethod(iter_json_lines))
+			setattr(BaseClass, "from_json_lines", staticmethod(from_json_lines))
 			setattr(BaseClass, "to_dict", to_dict)
 			setattr(BaseClass, "from_dict", staticmethod(from_dict))
 			return BaseClass
@@ -88,9 +117,18 @@ class JsonModel(Protocol):
 	__json__: JsonBindings
 	__schema__: Schema
 	def to_json(self: T) -> str: ...
+	def to_json_bytes(self: T) -> bytes: ...
 	@classmethod
-	def from_json(cls: type[T], json_string: str) -> T: ...
+	def from_json(cls: type[T], json_string: Union[str, bytes]) -> T: ...
 	@classmethod
 	def to_json_list(cls: type[T], *values: T) -> str: ...
 	@classmethod
-	def from_json_list(cls: type[T], json_string: str) -> list[T]: ...
+	def to_json_list_bytes(cls: type[T], *values: T) -> bytes: ...
+	@classmethod
+	def iter_json_list(cls: type[T], values: Iterable[T]) -> Iterator[bytes]: ...
+	@classmethod
+	def from_json_list(cls: type[T], json_string: Union[str, bytes]) -> list[T]: ...
+	@classmethod
+	def iter_json_lines(cls: type[T], values: Iterable[T]) -> Iterator[bytes]: ...
+	@classmethod
+	def from_json_lines(cls: type[T], json_lines: Union[str, bytes, Iterable[Union[str, bytes]]]) -> list[T]: ...
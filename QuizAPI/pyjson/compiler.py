@@ -0,0 +1,66 @@
+from typing import Any, Callable, TYPE_CHECKING
+
+from .json_types import JsonType, SimpleJsonType, ForeignJsonType, VariableListJsonType, Nullable
+
+if TYPE_CHECKING:
+	from .bindings import Schema
+
+simple_python_types = (str, int, float, bool)
+
+
+class SchemaCompiler:
+	def __init__(self, schema: "Schema"):
+		self.schema = schema
+		self.namespace: dict[str, Any] = {}
+
+	def bind(self, value: Any) -> str:
+		name = f"_bound_{len(self.namespace)}"
+		self.namespace[name] = value
+		return name
+
+	def serialize_expression(self, json_type: JsonType, variable: str, depth: int = 0) -> str:
+		if isinstance(json_type, SimpleJsonType):
+			return variable
+		if isinstance(json_type, ForeignJsonType):
+			return f"{variable}.to_dict()"
+		if isinstance(json_type, VariableListJsonType):
+			item = f"_item_{depth}"
+			item_expression = self.serialize_expression(json_type.json_type, item, depth + 1)
+			return f"list({variable})" if item_expression == item else f"[{item_expression} for {item} in {variable}]"
+		return f"{self.bind(json_type.serialize)}({variable})"
+
+	def deserialize_expression(self, json_type: JsonType, variable: str, depth: int = 0) -> str:
+		if isinstance(json_type, SimpleJsonType):
+			python_type = json_type.python_type
+			if isinstance(python_type, Nullable):
+				return f"(None if {variable} is None else {self.deserialize_expression(python_type.base_type, variable, depth)})"
+			if python_type in simple_python_types:
+				return f"{python_type.__name__}({variable})"
+			return f"{self.bind(python_type)}({variable})"
+		if isinstance(json_type, ForeignJsonType):
+			return f"{self.bind(json_type.model_class)}.from_dict({variable})"
+		if isinstance(json_type, VariableListJsonType):
+			item = f"_item_{depth}"
+			return f"[{self.deserialize_expression(json_type.json_type, item, depth + 1)} for {item} in {variable}]"
+		return f"{self.bind(json_type.deserialize)}({variable})"
+
+	def compile_function(self, name: str, lines: list[str]) -> Callable:
+		source = "\n".join(lines)
+		exec(compile(source, f"<pyjson {self.schema.python_class.__name__}.{name}>", "exec"), self.namespace)
+		return self.namespace[name]
+
+	def compile_to_dict(self) -> Callable[[Any], dict[str, Any]]:
+		lines = ["def to_dict(this):", "\tattributes = this.__dict__", "\treturn {"]
+		for field in self.schema.fields:
+			lines.append(f"\t\t{field.json_name!r}: {self.serialize_expression(field.json_type, f'attributes.get({field.python_name!r})')},")
+		lines.append("\t}")
+		return self.compile_function("to_dict", lines)
+
+	def compile_from_dict(self) -> Callable[[dict[str, Any]], Any]:
+		python_class = self.bind(self.schema.python_class)
+		lines = ["def from_dict(values):", f"\tthis = {python_class}.__new__({python_class})", "\tattributes = this.__dict__"]
+		for field in self.schema.fields:
+			lines.append(f"\tvalue = values.get({field.json_name!r})")
+			lines.append(f"\tattributes[{field.python_name!r}] = {self.deserialize_expression(field.json_type, 'value')}")
+		lines.append("\treturn this")
+		return self.compile_function("from_dict", lines)
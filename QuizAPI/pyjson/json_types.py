@@ -97,6 +97,8 @@ class Nullable:
 
 
 def json_field_type(field_type: "NullableJsonFieldType") -> "JsonType":
+	if isinstance(field_type, JsonType):
+		return field_type
 	if type(field_type) is list:
 		if len(field_type) == 2 and field_type[1] is ...:
 			return VariableListJsonType(json_field_type(field_type[0]))
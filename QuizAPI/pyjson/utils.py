@@ -1,9 +1,9 @@
 from typing import Union, TYPE_CHECKING
 
 if TYPE_CHECKING:
-	from .json_types import Nullable
+	from .json_types import Nullable, JsonType
 
 NoneType = type(None)
 JsonFieldType = Union[type, list["NullableJsonFieldType"], dict[str, "NullableJsonFieldType"]]
-NullableJsonFieldType = Union[JsonFieldType, "Nullable"]
+NullableJsonFieldType = Union[JsonFieldType, "Nullable", "JsonType"]
 JsonAliasedType = Union[NullableJsonFieldType, tuple[NullableJsonFieldType, str], tuple[str, NullableJsonFieldType]]
@@ -1,12 +1,15 @@
 from .alter_table import *
 from .common import *
 from .constraints import *
+from .create_index import *
 from .create_table import *
 from .database import *
 from .delete import *
 from .drop_table import *
 from .insert import *
 from .join import *
+from .migration import *
 from .select import *
+from .transaction import *
 from .update import *
 from .utils import *
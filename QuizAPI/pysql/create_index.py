@@ -0,0 +1,87 @@
+from typing import Iterable, TYPE_CHECKING
+
+from .common import SQLElement
+from .drop_table import DropOptions
+from .utils import quote_sql_name, join_sql_string
+
+if TYPE_CHECKING:
+	from .constraints import KeyConstraint
+
+
+class CreateIndexOptions:
+	def __init__(self, if_not_exists: bool = False):
+		self.if_not_exists = if_not_exists
+
+
+class CreateIndex(SQLElement):
+	def __init__(self, name: str, table: str, columns: Iterable["KeyConstraint.IndexedColumnType"], unique: bool = False, condition: str = None, create_options: CreateIndexOptions = None):
+		self.name = name
+		self.table = table
+		self.columns = columns
+		self.is_unique = unique
+		self.condition = condition
+		self.create_options = create_options or CreateIndexOptions()
+
+	def with_create_options(self, create_options: CreateIndexOptions) -> "CreateIndex":
+		self.create_options = create_options
+		return self
+
+	def if_not_exists(self, if_not_exists: bool = True) -> "CreateIndex":
+		self.create_options.if_not_exists = if_not_exists
+		return self
+
+	def unique(self, unique: bool = True) -> "CreateIndex":
+		self.is_unique = unique
+		return self
+
+	def where(self, condition: str) -> "CreateIndex":
+		self.condition = condition
+		return self
+
+	def build_sql(self) -> str:
+		if not self.columns:
+			raise RuntimeError("Cannot create an index without any column")
+		unique = "UNIQUE" if self.is_unique else None
+		if_not_exists = "IF NOT EXISTS" if self.create_options.if_not_exists else None
+		columns = join_sql_string(", ", *[quote_sql_name(column) if type(column) is str else (quote_sql_name(column[0]) + (" DESC" if column[1] else "")) for column in self.columns])
+		where = f"WHERE {self.condition}" if self.condition else None
+		return join_sql_string(" ", "CREATE", unique, "INDEX", if_not_exists, quote_sql_name(self.name), "ON", quote_sql_name(self.table), f"({columns})", where)
+
+
+class DropIndex(SQLElement):
+	def __init__(self, name: str, drop_options: DropOptions = None):
+		self.name = name
+		self.drop_options = drop_options or DropOptions()
+
+	def with_drop_options(self, drop_options: DropOptions) -> "DropIndex":
+		self.drop_options = drop_options
+		return self
+
+	def if_exists(self, if_exists: bool = True) -> "DropIndex":
+		self.drop_options.if_exists = if_exists
+		return self
+
+	def build_sql(self) -> str:
+		if_exists = "IF EXISTS" if self.drop_options.if_exists else None
+		return join_sql_string(" ", "DROP INDEX", if_exists, quote_sql_name(self.name))
+
+
+class Index:
+	def __init__(self, *columns: "KeyConstraint.IndexedColumnType", unique: bool = False, condition: str = None):
+		self.name = None
+		self.columns = columns
+		self.unique = unique
+		self.condition = condition
+
+	def with_name(self, name: str) -> "Index":
+		self.name = name
+		return self
+
+	def get_name(self, table: str) -> str:
+		return self.name or join_sql_string("_", table, *[column if type(column) is str else column[0] for column in self.columns], "index")
+
+	def create(self, table: str, create_options: CreateIndexOptions = None) -> CreateIndex:
+		return CreateIndex(self.get_name(table), table, self.columns, self.unique, self.condition, create_options)
+
+	def drop(self, table: str, drop_options: DropOptions = None) -> DropIndex:
+		return DropIndex(self.get_name(table), drop_options)
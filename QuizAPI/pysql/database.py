@@ -1,38 +1,63 @@
-from threading import Lock
-from collections import Counter
-from sqlite3 import connect, sqlite_version_info
-from typing import Union, Iterable, TYPE_CHECKING, TypeVar, Protocol
+from os import register_at_fork
+from threading import Lock, RLock, local
+from weakref import WeakSet
+from collections import Counter, defaultdict
+from contextlib import nullcontext, contextmanager
+from functools import wraps, lru_cache
+from re import compile as compile_pattern, IGNORECASE
+from sqlite3 import Connection, connect, sqlite_version_info
+from time import perf_counter
+from typing import Union, Iterable, TYPE_CHECKING, TypeVar, Protocol, Iterator, Callable, Optional
 
 from .common import Column
-from .constraints import PrimaryKey, TableConstraint, Primary
+from .constraints import PrimaryKey, TableConstraint, Primary, Foreign
 from .create_table import CreateTable, TableOption, WithoutRowID
+from .create_index import CreateIndex, Index
 from .alter_table import AlterTable
 from .drop_table import DropTable
 from .select import Select
 from .insert import Insert
 from .update import Update
 from .delete import Delete
-from .utils import flatten, filter_type, join_sql_string, quote_sql_name, placeholder
+from .transaction import Begin, Commit, Rollback, Savepoint, Release
+from .migration import SchemaMigration, get_schema_fingerprint
+from .utils import flatten, filter_type, join_sql_string, quote_sql_name, unquote_sql_name, placeholder, raw_sql
 
 if TYPE_CHECKING:
 	from sqlite3 import Cursor
 	from .create_table import CreateOptions
+	from .create_index import CreateIndexOptions
 	from .alter_table import AlterAction
 	from .drop_table import DropOptions
+	from .transaction import TransactionMode
+	from .migration import Renames
 
 T = TypeVar("T", bound="DatabaseModel")
+OrderBy = Union[str, tuple[str, bool], list[Union[str, tuple[str, bool]]]]
+F = TypeVar("F", bound=Callable)
+P = TypeVar("P", bound="DatabaseModel")
 
 does_sqlite3_supports_returning_clause = sqlite_version_info[1] >= 35
+max_prefetch_parameters = 500
+max_insert_parameters = 999
+statement_literal_pattern = compile_pattern(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|:\w+|\?")
+statement_values_pattern = compile_pattern(r"(\([?, ]*\))(?:\s*,\s*\([?, ]*\))+")
+statement_list_pattern = compile_pattern(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+versions_table = "pysql_versions"
+transaction_control_pattern = compile_pattern(r"^\s*(?:BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE)\b", IGNORECASE)
+written_table_pattern = compile_pattern(r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|(?:CREATE|DROP|ALTER)\s+TABLE(?:\s+IF(?:\s+NOT)?\s+EXISTS)?)\s+(`(?:[^`]|``)+`|\w+)", IGNORECASE)
 
 
 class Table:
-	def __init__(self, python_class: type, name: str, columns: Iterable[Column], constraints: Iterable[TableConstraint], options: Iterable[TableOption]):
+	def __init__(self, python_class: type, name: str, columns: Iterable[Column], constraints: Iterable[TableConstraint], options: Iterable[TableOption], indexes: Iterable[Index] = ()):
 		self.python_class = python_class
 		self.name = name
 		self.columns = {column.sql_name: column for column in columns}
 		self.constraints = constraints
 		self.options = options
+		self.indexes = list(indexes)
 		self.computed_ids = None
+		self.row_binders: dict[tuple[str, ...], Callable[[tuple, object], object]] = {}
 
 	def get_column(self, sql_name: str) -> Column:
 		return self.columns[sql_name]
@@ -43,6 +68,13 @@ class Table:
 				return column
 		raise KeyError(f"No column with python name {python_name} in table {self.name}")
 
+	def get_foreign_column(self, foreign_table: str) -> tuple[Column, Foreign]:
+		for column in self.columns.values():
+			for foreign in filter_type(column.column_constraints, Foreign):
+				if foreign.table == foreign_table:
+					return column, foreign
+		raise KeyError(f"No column referencing table {foreign_table} in table {self.name}")
+
 	def get_ids(self) -> list[str]:
 		if self.computed_ids is not None:
 			return self.computed_ids
@@ -55,6 +87,9 @@ class Table:
 	def create(self, create_options: "CreateOptions" = None) -> CreateTable:
 		return CreateTable(self.name, self.columns.values(), self.constraints, self.options, create_options)
 
+	def create_indexes(self, create_options: "CreateIndexOptions" = None) -> list[CreateIndex]:
+		return [index.create(self.name, create_options) for index in self.indexes]
+
 	def alter(self, alter_action: "AlterAction" = None) -> AlterTable:
 		return AlterTable(self.name, alter_action)
 
@@ -69,14 +104,17 @@ class Table:
 			select.where(self.get_ids_condition())
 		return select
 
-	def insert(self, *use_default_for: str):
+	def insert(self, *use_default_for: str, rows: int = None):
 		insert = Insert(self.name)
 		for column in self.columns.values():
 			if column.python_name in use_default_for:
 				if does_sqlite3_supports_returning_clause:
 					insert.returning_column(column.sql_name)
-			else:
+			elif rows is None:
 				insert.value(column.sql_name, placeholder(column.sql_name))
+			else:
+				for i in range(rows):
+					insert.value(column.sql_name, placeholder(f"{column.sql_name}_{i}"))
 		return insert
 
 	def update(self):
@@ -92,58 +130,404 @@ class Table:
 		return delete.where(self.get_ids_condition()) if where_id else delete
 
 
+def get_written_table(sql: str) -> Optional[str]:
+	match = written_table_pattern.match(sql)
+	return unquote_sql_name(match[1]) if match else None
+
+
+def is_transaction_control(sql: str) -> bool:
+	return transaction_control_pattern.match(sql) is not None
+
+
+@lru_cache(maxsize=1024)
+def get_statement_shape(sql: str) -> str:
+	# Literals and placeholders are replaced, so statements only differing by their values (or rows count) share a shape
+	shape = statement_literal_pattern.sub("?", sql)
+	shape = statement_values_pattern.sub(r"\1, ...", shape)
+	shape = statement_list_pattern.sub("(?, ...)", shape)
+	return " ".join(shape.split())
+
+
+def order_select(select: Select, order_by: OrderBy) -> Select:
+	for order in order_by if type(order_by) is list else [order_by]:
+		column, desc = order if type(order) is tuple else (order, False)
+		select.order_by(column, desc)
+	return select
+
+
+def compile_row_binder(table: Table, column_names: tuple[str, ...]) -> Callable[[tuple, object], object]:
+	columns = [table.get_column(column_name) for column_name in column_names]
+	namespace = {f"type_{i}": column.type_ for i, column in enumerate(columns)}
+	# Values already of the column type (as SQLite usually returns them) are stored without conversion
+	values = [f"{column.python_name!r}: value_{i} if value_{i} is None or value_{i}.__class__ is type_{i} else type_{i}(value_{i})" for i, column in enumerate(columns)]
+	unpack = "".join(f"value_{i}, " for i in range(len(columns)))
+	source = f"def bind(row, obj):\n\t{unpack}= row\n\tobj.__dict__.update({{{', '.join(values)}}})\n\treturn obj"
+	exec(compile(source, f"<pysql {table.name} row binder>", "exec"), namespace)
+	return namespace["bind"]
+
+
+def get_row_binder(table: Table, cur: "Cursor", size: int) -> Callable[[tuple, object], object]:
+	column_names = tuple(column[0] for column in cur.description[:size])
+	binder = table.row_binders.get(column_names)
+	if binder is None:
+		binder = table.row_binders[column_names] = compile_row_binder(table, column_names)
+	return binder
+
+
 def bind_new(table: Table, cur: "Cursor", row: tuple):
 	# noinspection PyArgumentList
 	return bind_object(table, cur, row, table.python_class.__new__(table.python_class))
 
 
 def bind_object(table: Table, cur: "Cursor", row: tuple, obj):
-	columns = [table.get_column(column[0]) for column in cur.description]
-	for i in range(len(columns)):
-		column = columns[i]
-		obj.__dict__[column.python_name] = None if row[i] is None else column.type_(row[i])
-	return obj
+	return get_row_binder(table, cur, len(row))(row, obj)
+
+
+def bind_many(table: Table, cur: "Cursor", rows: list[tuple]) -> list:
+	if not rows:
+		return []
+	binder = get_row_binder(table, cur, len(rows[0]))
+	python_class = table.python_class
+	new = python_class.__new__
+	# noinspection PyArgumentList
+	return [binder(row, new(python_class)) for row in rows]
+
+
+class QueryListener:
+	def query_executed(self, sql: str, lock_wait: float, duration: float, rows_affected: int):
+		pass
+
+	def rows_fetched(self, sql: str, rows: int, duration: float):
+		pass
+
+
+class ThreadConnection(Connection):
+	# Only referenced by the thread local storage, so the connection is closed when its thread ends
+	# Versions are cached per connection along with the data version they were read at
+	versions: Optional[tuple[int, dict[str, int]]] = None
+
+
+class TimedLock:
+	def __init__(self, lock: RLock, thread_local: local):
+		self.lock = lock
+		self.thread_local = thread_local
+
+	def __enter__(self):
+		start = perf_counter()
+		self.lock.acquire()
+		self.thread_local.lock_wait = getattr(self.thread_local, "lock_wait", 0.0) + perf_counter() - start
+
+	def __exit__(self, *exc_info):
+		self.lock.release()
+
+
+databases: WeakSet["Database"] = WeakSet()
+
+
+def reset_databases_after_fork():
+	for database in databases:
+		database.reset_after_fork()
+
+
+register_at_fork(after_in_child=reset_databases_after_fork)
 
 
 class Database:
-	def __init__(self, file: str = "database.db", auto_create_tables: bool = False, table_create_options: "CreateOptions" = None, debug: bool = False):
+	def __init__(self, file: str = "database.db", auto_create_tables: bool = False, table_create_options: "CreateOptions" = None, debug: bool = False, connection_per_thread: bool = False, journal_mode: str = None, busy_timeout: float = 5.0, shared_versions: bool = False):
+		if connection_per_thread and file == ":memory:":
+			raise RuntimeError("Cannot use a connection per thread with an in-memory database")
 		self.file = file
-		self.connection = connect(file, isolation_level=None, check_same_thread=False)
+		self.connection_per_thread = connection_per_thread
+		self.journal_mode = journal_mode
+		self.busy_timeout = busy_timeout
 		self.tables: dict[str, Table] = {}
 		self.auto_create_tables = auto_create_tables
 		self.table_create_options = table_create_options
 		self.debug = debug
-		self._sql_execution_lock = Lock()
-		self.execute("PRAGMA encoding=utf8")
+		# Shared versions are stored in the database, so they are the same for every process using it
+		self.shared_versions = shared_versions
+		self.versions: dict[str, int] = defaultdict(int)
+		self._versions_lock = Lock()
+		self.listeners: list[QueryListener] = []
+		self.renames: "Renames" = {}
+		self.migration_hooks: list[Callable[[], None]] = []
+		self._inherited_connections: list[Connection] = []
+		# The schema is created or migrated on the first use of a connection, once all the models are registered
+		self._schema_ready = not auto_create_tables
+		self._schema_lock = Lock()
+		self.reset_connections()
+		databases.add(self)
+
+	def reset_connections(self):
+		self.connections: WeakSet[ThreadConnection] = WeakSet()
+		self._connections_lock = Lock()
+		self._thread_local = local()
+		self._shared_connection = None
+		# With a single shared connection, the lock must be held until the cursor is consumed
+		# Connections per thread are never shared, so SQLite's own locking is enough
+		self._sql_execution_lock = nullcontext() if self.connection_per_thread else TimedLock(RLock(), self._thread_local)
+
+	def reset_after_fork(self):
+		# SQLite connections must not be used across a fork (e.g. gunicorn --preload), the child process opens its own
+		# The inherited ones are kept open, closing them could checkpoint or unlock the database of the parent process
+		self._inherited_connections.extend(self.connections)
+		self.reset_connections()
+
+	def connect(self) -> Connection:
+		connection = connect(self.file, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False, factory=ThreadConnection)
+		if self.journal_mode:
+			connection.execute(f"PRAGMA journal_mode={self.journal_mode}").close()
+		if self.shared_versions:
+			connection.execute(f"CREATE TABLE IF NOT EXISTS {versions_table} (name TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID").close()
+		with self._connections_lock:
+			self.connections.add(connection)
+		return connection
+
+	@property
+	def connection(self) -> Connection:
+		if not self._schema_ready:
+			self.ensure_schema()
+		if not self.connection_per_thread:
+			# Statements are executed while holding the execution lock, so the shared connection is only opened once
+			if self._shared_connection is None:
+				self._shared_connection = self.connect()
+			return self._shared_connection
+		connection = getattr(self._thread_local, "connection", None)
+		if connection is None:
+			connection = self._thread_local.connection = self.connect()
+		return connection
+
+	def ensure_schema(self):
+		if getattr(self._thread_local, "bootstrapping", False):
+			return
+		with self._schema_lock:
+			if self._schema_ready:
+				return
+			self._thread_local.bootstrapping = True
+			try:
+				self.migrate()
+				self._schema_ready = True
+			finally:
+				self._thread_local.bootstrapping = False
+
+	def in_transaction(self) -> bool:
+		return getattr(self._thread_local, "transaction_depth", 0) > 0
+
+	def is_standalone_write(self, sql: str) -> bool:
+		# With shared versions, a write outside a transaction would be committed apart from the new version of its table
+		return self.shared_versions and not self.in_transaction() and get_written_table(sql) not in (None, versions_table)
 
 	def execute(self, sql: str, **parameters):
+		if self.is_standalone_write(sql):
+			with self.transaction():
+				return self.execute(sql, **parameters)
+		if self.debug:
+			print(f"SQL: {sql}")
+			for param, value in parameters.items():
+				if isinstance(value, str):
+					value = value.encode("UTF-8")
+				print(f"\t{param}: {value}")
+		with self._sql_execution_lock:
+			start = perf_counter()
+			cur = self.connection.execute(sql, parameters)
+			duration = perf_counter() - start
+		self.touch(get_written_table(sql))
+		self.notify_query(sql, duration, cur.rowcount)
+		return cur
+
+	def execute_many(self, sql: str, parameters: Iterable[dict]):
+		if self.is_standalone_write(sql):
+			with self.transaction():
+				return self.execute_many(sql, parameters)
+		if self.debug:
+			print(f"SQL (many): {sql}")
+		with self._sql_execution_lock:
+			start = perf_counter()
+			cur = self.connection.executemany(sql, parameters)
+			duration = perf_counter() - start
+		self.touch(get_written_table(sql))
+		self.notify_query(sql, duration, cur.rowcount)
+		return cur
+
+	def add_listener(self, listener: QueryListener):
+		self.listeners.append(listener)
+
+	def remove_listener(self, listener: QueryListener):
+		self.listeners.remove(listener)
+
+	def notify_query(self, sql: str, duration: float, rows_affected: int):
+		# The lock accumulates its wait time, including when it was acquired by the caller before executing
+		lock_wait = getattr(self._thread_local, "lock_wait", 0.0)
+		self._thread_local.lock_wait = 0.0
+		for listener in self.listeners:
+			listener.query_executed(sql, lock_wait, duration, max(rows_affected, 0))
+
+	def notify_rows(self, sql: str, rows: int, duration: float):
+		for listener in self.listeners:
+			listener.rows_fetched(sql, rows, duration)
+
+	def touch(self, *tables: Optional[str]):
+		tables = [table for table in tables if table and table != versions_table]
+		if not tables:
+			return
+		if self.in_transaction():
+			# Readers must not see the new version before the data is committed
+			self._thread_local.touched_tables.update(tables)
+		else:
+			self.bump_versions(*tables)
+
+	def bump_versions(self, *tables: str):
+		if not tables:
+			return
+		if not self.shared_versions:
+			with self._versions_lock:
+				for table in tables:
+					self.versions[table] += 1
+			return
+		# Random versions never repeat, even when the database file is recreated
 		with self._sql_execution_lock:
-			if self.debug:
-				print(f"SQL: {sql}")
-				for param, value in parameters.items():
-					if isinstance(value, str):
-						value = value.encode("UTF-8")
-					print(f"\t{param}: {value}")
-			return self.connection.execute(sql, parameters)
+			connection = self.connection
+			connection.executemany(f"INSERT INTO {versions_table} (name, version) VALUES (?, random() & 9223372036854775807) ON CONFLICT (name) DO UPDATE SET version = excluded.version", [(table,) for table in tables]).close()
+			# The data version only changes with the commits of other connections
+			connection.versions = None
+
+	def get_versions(self, *tables: str) -> tuple[int, ...]:
+		if not self.shared_versions:
+			return tuple(self.versions[table] for table in tables)
+		with self._sql_execution_lock:
+			connection = self.connection
+			cur = connection.execute("PRAGMA data_version")
+			data_version = cur.fetchone()[0]
+			cur.close()
+			if connection.versions is None or connection.versions[0] != data_version:
+				cur = connection.execute(f"SELECT name, version FROM {versions_table}")
+				connection.versions = data_version, dict(cur.fetchall())
+				cur.close()
+			versions = connection.versions[1]
+		return tuple(versions.get(table, 0) for table in tables)
 
 	def fetch_one(self, table: Table, sql: str, **parameters):
-		cur = self.execute(sql, **parameters)
-		row = cur.fetchone()
-		obj = None if row is None else bind_new(table, cur, row)
-		cur.close()
+		with self._sql_execution_lock:
+			cur = self.execute(sql, **parameters)
+			start = perf_counter()
+			row = cur.fetchone()
+			obj = None if row is None else bind_new(table, cur, row)
+			cur.close()
+		self.notify_rows(sql, int(row is not None), perf_counter() - start)
 		return obj
 
 	def fetch_many(self, table: Table, sql: str, **parameters) -> list:
-		cur = self.execute(sql, **parameters)
-		rows = cur.fetchall()
-		objects = [bind_new(table, cur, row) for row in rows]
-		cur.close()
+		with self._sql_execution_lock:
+			cur = self.execute(sql, **parameters)
+			start = perf_counter()
+			rows = cur.fetchall()
+			objects = bind_many(table, cur, rows)
+			cur.close()
+		self.notify_rows(sql, len(objects), perf_counter() - start)
 		return objects
 
+	@contextmanager
+	def transaction(self, mode: "TransactionMode" = "IMMEDIATE") -> Iterator["Database"]:
+		with self._sql_execution_lock:
+			depth = getattr(self._thread_local, "transaction_depth", 0)
+			savepoint = f"transaction_{depth}" if depth else None
+			self.execute((Savepoint(savepoint) if savepoint else Begin(mode)).build_sql()).close()
+			self._thread_local.transaction_depth = depth + 1
+			if not depth:
+				self._thread_local.touched_tables = set()
+				if self.shared_versions:
+					# Versions read in the transaction come from its snapshot, like the data read along with them
+					self.connection.versions = None
+			touched_before = set(self._thread_local.touched_tables)
+			try:
+				yield self
+				if not depth and self.shared_versions:
+					# Committed along with the data, so other processes never see one without the other
+					self.bump_versions(*self._thread_local.touched_tables)
+				self.execute((Release(savepoint) if savepoint else Commit()).build_sql()).close()
+			except BaseException:
+				self.execute(Rollback(savepoint).build_sql()).close()
+				if savepoint:
+					self.execute(Release(savepoint).build_sql()).close()
+				# Rolled back writes changed nothing, so they must not make the tables outdated
+				self._thread_local.touched_tables = touched_before
+				raise
+			finally:
+				self._thread_local.transaction_depth = depth
+				if not depth and self.shared_versions:
+					self.connection.versions = None
+			if not depth and not self.shared_versions:
+				self.bump_versions(*self._thread_local.touched_tables)
+
+	def transactional(self, handler: F) -> F:
+		@wraps(handler)
+		def wrapper(*args, **kwargs):
+			with self.transaction():
+				return handler(*args, **kwargs)
+		return wrapper
+
+	def fetch_batches(self, table: Table, sql: str, batch_size: int = 100, **parameters) -> Iterator[list]:
+		# The lock is only held while fetching each batch, other statements may run while the batch is consumed
+		# Closing the generator (or dropping it) closes the cursor and ends its read transaction
+		with self._sql_execution_lock:
+			cur = self.execute(sql, **parameters)
+		try:
+			while True:
+				with self._sql_execution_lock:
+					start = perf_counter()
+					rows = cur.fetchmany(batch_size)
+					objects = bind_many(table, cur, rows)
+				self.notify_rows(sql, len(objects), perf_counter() - start)
+				if not objects:
+					break
+				yield objects
+		finally:
+			cur.close()
+
+	def fetch_iter(self, table: Table, sql: str, batch_size: int = 100, **parameters) -> Iterator:
+		for objects in self.fetch_batches(table, sql, batch_size, **parameters):
+			yield from objects
+
 	def register_table(self, table: Table):
 		self.tables[table.name] = table
 		if self.auto_create_tables:
-			self.execute(table.create().if_not_exists().build_sql()).close()
+			self._schema_ready = False
+
+	def rename_column(self, table: str, old_name: str, new_name: str):
+		# Without the hint, the migration would drop the old column and add an empty new one
+		self.renames.setdefault(table, {})[old_name] = new_name
+
+	def add_migration_hook(self, hook: F) -> F:
+		# Runs in the migration transaction after the schema changes, to migrate the data along with it
+		self.migration_hooks.append(hook)
+		return hook
+
+	def get_schema_version(self) -> int:
+		cur = self.execute("PRAGMA user_version")
+		version = cur.fetchone()[0]
+		cur.close()
+		return version
+
+	def migrate(self, renames: "Renames" = None) -> list[str]:
+		fingerprint = get_schema_fingerprint(self.tables.values())
+		version = self.get_schema_version()
+		if version == fingerprint:
+			return []
+		if version == 0:
+			# Only effective before the database content is created
+			self.execute("PRAGMA encoding=utf8").close()
+		with self.transaction():
+			# Another process may have migrated the schema while this one was waiting for the write lock
+			if self.get_schema_version() == fingerprint:
+				return []
+			steps = SchemaMigration(self, renames or self.renames).run()
+			for hook in self.migration_hooks:
+				hook()
+			self.execute(f"PRAGMA user_version = {fingerprint}").close()
+		if self.debug:
+			for step in steps:
+				print(f"Migration: {step}")
+		return steps
 
 	def get_table(self, name: Union[str, type]) -> Table:
 		if type(name) is str:
@@ -153,39 +537,70 @@ class Database:
 				return table
 		raise KeyError(f"No table definition for class: {name.__name__}")
 
-	def model(self, table: str = None, *definition: Union[Column, TableConstraint, TableOption]):
+	def model(self, table: str = None, *definition: Union[Column, TableConstraint, TableOption, Index]):
 		columns = filter_type(definition, Column)
 		constraints = filter_type(definition, TableConstraint)
 		options = filter_type(definition, TableOption)
+		indexes = filter_type(definition, Index)
 
 		# noinspection PyPep8Naming
 		# The decorator is applied to classes, thus the argument is in fact a class
 		def decorator(BaseClass: type[T]) -> type[T]:
 			name = table or str(BaseClass.__name__)
-			db_table = Table(BaseClass, name, columns, constraints, options)
+			db_table = Table(BaseClass, name, columns, constraints, options, indexes)
 			self.register_table(db_table)
 
 			def add(this: BaseClass, *use_default_for: str) -> bool:
-				values = {col.sql_name: this.__dict__[col.python_name] for col in db_table.columns.values() if col.python_name not in use_default_for}
-				cur = self.execute(db_table.insert(*use_default_for).build_sql(), **values)
-				result = cur.rowcount == 1
-				if not does_sqlite3_supports_returning_clause:
-					if list(filter_type(db_table.options, WithoutRowID)):
+				# The RETURNING rows are read after the insert, so the transaction committing it along with its version must wrap both
+				with self.transaction() if self.shared_versions and not self.in_transaction() else self._sql_execution_lock:
+					values = {col.sql_name: this.__dict__[col.python_name] for col in db_table.columns.values() if col.python_name not in use_default_for}
+					cur = self.execute(db_table.insert(*use_default_for).build_sql(), **values)
+					result = cur.rowcount == 1
+					if not does_sqlite3_supports_returning_clause:
+						if list(filter_type(db_table.options, WithoutRowID)):
+							cur.close()
+							return result
+						inserted_rowid = cur.lastrowid
 						cur.close()
-						return result
-					inserted_rowid = cur.lastrowid
+						inserted_values_query = Select().from_table(db_table.name)
+						for col in db_table.columns.values():
+							if col.python_name in use_default_for:
+								inserted_values_query.column(col.sql_name)
+						inserted_values_query.where(f"_rowid_ = {inserted_rowid}")
+						cur = self.execute(inserted_values_query.build_sql())
+					inserted = cur.fetchone()
+					if inserted is not None:
+						bind_object(db_table, cur, inserted, this)
 					cur.close()
-					inserted_values_query = Select().from_table(db_table.name)
-					for col in db_table.columns.values():
-						if col.python_name in use_default_for:
-							inserted_values_query.column(col.sql_name)
-					inserted_values_query.where(f"_rowid_ = {inserted_rowid}")
-					cur = self.execute(inserted_values_query.build_sql())
-				inserted = cur.fetchone()
-				if inserted is not None:
-					bind_object(db_table, cur, inserted, this)
-				cur.close()
-				return result
+					return result
+
+			def add_many(objects: Iterable[BaseClass], *use_default_for: str) -> int:
+				objects = list(objects)
+				if not objects:
+					return 0
+				value_columns = [col for col in db_table.columns.values() if col.python_name not in use_default_for]
+				with self.transaction():
+					if not use_default_for:
+						cur = self.execute_many(db_table.insert().build_sql(), [{col.sql_name: obj.__dict__[col.python_name] for col in value_columns} for obj in objects])
+						inserted = cur.rowcount
+						cur.close()
+						return inserted
+					if not does_sqlite3_supports_returning_clause or not value_columns or list(filter_type(db_table.options, WithoutRowID)):
+						return sum(obj.add(*use_default_for) for obj in objects)
+					inserted = 0
+					rows_per_statement = max(1, max_insert_parameters // len(value_columns))
+					for start in range(0, len(objects), rows_per_statement):
+						chunk = objects[start:start + rows_per_statement]
+						# SQLite does not guarantee the order of RETURNING rows, but rowids are allocated in insertion order
+						insert = db_table.insert(*use_default_for, rows=len(chunk)).returning_column(raw_sql("_rowid_"))
+						values = {f"{col.sql_name}_{i}": obj.__dict__[col.python_name] for i, obj in enumerate(chunk) for col in value_columns}
+						cur = self.execute(insert.build_sql(), **values)
+						rows = sorted(cur.fetchall(), key=lambda row: row[-1])
+						for obj, row in zip(chunk, rows):
+							bind_object(db_table, cur, row[:-1], obj)
+						cur.close()
+						inserted += len(rows)
+					return inserted
 
 			def save(this: BaseClass) -> bool:
 				values = {col.sql_name: this.__dict__[col.python_name] for col in db_table.columns.values()}
@@ -202,22 +617,48 @@ class Database:
 				cur.close()
 				return result
 
-			def list_(condition: str = None, order_by: Union[str, tuple[str, bool]] = None, **parameters) -> list[BaseClass]:
-				select = db_table.select().where(condition)
+			def list_(condition: str = None, order_by: OrderBy = None, limit: int = -1, offset: int = 0, **parameters) -> list[BaseClass]:
+				select = db_table.select().where(condition).with_limit(limit).with_offset(offset)
 				if order_by:
-					if type(order_by) is tuple:
-						column, order = order_by
-					else:
-						column, order = order_by, False
-					select.order_by(column, order)
+					order_select(select, order_by)
 				return self.fetch_many(db_table, select.build_sql(), **parameters)
 
+			def iter_batches(condition: str = None, order_by: OrderBy = None, batch_size: int = 100, **parameters) -> Iterator[list[BaseClass]]:
+				select = db_table.select().where(condition)
+				if order_by:
+					order_select(select, order_by)
+				return self.fetch_batches(db_table, select.build_sql(), batch_size, **parameters)
+
+			def iter_(condition: str = None, order_by: OrderBy = None, batch_size: int = 100, **parameters) -> Iterator[BaseClass]:
+				for objects in iter_batches(condition, order_by, batch_size, **parameters):
+					yield from objects
+
+			def prefetch(parents: Iterable[P], attribute: str, order_by: OrderBy = None) -> list[P]:
+				parents = list(parents)
+				if not parents:
+					return parents
+				foreign_column, foreign = db_table.get_foreign_column(type(parents[0]).__table__.name)
+				referenced_column = self.get_table(foreign.table).get_column(foreign.column)
+				children = {}
+				keys = list({parent.__dict__[referenced_column.python_name] for parent in parents})
+				for start in range(0, len(keys), max_prefetch_parameters):
+					chunk = keys[start:start + max_prefetch_parameters]
+					parameters = {f"{foreign_column.sql_name}_{i}": key for i, key in enumerate(chunk)}
+					condition = quote_sql_name(foreign_column.sql_name) + join_sql_string(", ", *[placeholder(name) for name in parameters.keys()], start=" IN (", end=")")
+					select = db_table.select().where(condition)
+					order_select(select, order_by or db_table.get_ids())
+					for child in self.fetch_many(db_table, select.build_sql(), **parameters):
+						children.setdefault(child.__dict__[foreign_column.python_name], []).append(child)
+				for parent in parents:
+					parent.__dict__[attribute] = children.get(parent.__dict__[referenced_column.python_name], [])
+				return parents
+
 			def count(condition: str = None, **parameters) -> int:
-				cur = self.execute(Select().value("count(*)").from_table(db_table.name).where(condition).build_sql(), **parameters)
-				row = cur.fetchone()
-				total = row[0] if row else 0
-				cur.close()
-				return total
+				with self._sql_execution_lock:
+					cur = self.execute(Select().value("count(*)").from_table(db_table.name).where(condition).build_sql(), **parameters)
+					row = cur.fetchone()
+					cur.close()
+				return row[0] if row else 0
 
 			def get(**ids) -> BaseClass:
 				table_ids = db_table.get_ids()
@@ -230,9 +671,13 @@ class Database:
 			setattr(BaseClass, "__database__", self)
 			setattr(BaseClass, "__table__", db_table)
 			setattr(BaseClass, "add", add)
+			setattr(BaseClass, "add_many", staticmethod(add_many))
 			setattr(BaseClass, "save", save)
 			setattr(BaseClass, "delete", delete)
 			setattr(BaseClass, "list", staticmethod(list_))
+			setattr(BaseClass, "iter", staticmethod(iter_))
+			setattr(BaseClass, "iter_batches", staticmethod(iter_batches))
+			setattr(BaseClass, "prefetch", staticmethod(prefetch))
 			setattr(BaseClass, "count", staticmethod(count))
 			setattr(BaseClass, "get", staticmethod(get))
 			return BaseClass
@@ -240,7 +685,10 @@ class Database:
 		return decorator
 
 	def close(self):
-		self.connection.close()
+		with self._connections_lock:
+			for connection in list(self.connections):
+				connection.close()
+			self.connections.clear()
 
 	def __del__(self):
 		self.close()
@@ -250,10 +698,18 @@ class DatabaseModel(Protocol):
 	__database__: Database
 	__table__: Table
 	def add(self: T, *use_default_for: str) -> bool: ...
+	@staticmethod
+	def add_many(objects: Iterable[T], *use_default_for: str) -> int: ...
 	def save(self: T) -> bool: ...
 	def delete(self: T) -> bool: ...
 	@classmethod
-	def list(cls: type[T], condition: str = None, order_by: Union[str, tuple[str, bool]] = None, **parameters) -> list[T]: ...
+	def iter(cls: type[T], condition: str = None, order_by: OrderBy = None, batch_size: int = 100, **parameters) -> Iterator[T]: ...
+	@classmethod
+	def iter_batches(cls: type[T], condition: str = None, order_by: OrderBy = None, batch_size: int = 100, **parameters) -> Iterator[list[T]]: ...
+	@staticmethod
+	def prefetch(parents: Iterable[P], attribute: str, order_by: OrderBy = None) -> list[P]: ...
+	@classmethod
+	def list(cls: type[T], condition: str = None, order_by: OrderBy = None, limit: int = -1, offset: int = 0, **parameters) -> list[T]: ...
 	@staticmethod
 	def count(condition: str = None, **parameters) -> int: ...
 	@classmethod
@@ -0,0 +1,148 @@
+from sqlite3 import OperationalError, sqlite_version_info
+from typing import TYPE_CHECKING, Iterable
+from zlib import crc32
+
+from .alter_table import AlterTable
+from .constraints import Primary, Unique, NotNull, Default, Foreign
+from .create_index import DropIndex
+from .create_table import WithoutRowID
+from .drop_table import DropTable
+from .utils import filter_type, quote_sql_name, join_sql_string, type_to_sql
+
+if TYPE_CHECKING:
+	from .common import Column
+	from .database import Database, Table
+
+does_sqlite3_supports_drop_column = sqlite_version_info >= (3, 35)
+Renames = dict[str, dict[str, str]]
+
+
+def get_schema_fingerprint(tables: Iterable["Table"]) -> int:
+	definitions = []
+	for table in sorted(tables, key=lambda table: table.name):
+		definitions.append(table.create().build_sql())
+		definitions.extend(sorted(create_index.build_sql() for create_index in table.create_indexes()))
+	# PRAGMA user_version is a signed 32 bits integer, and 0 is the version of a new database
+	return crc32(";".join(definitions).encode("UTF-8")) & 0x7FFFFFFF or 1
+
+
+def can_add_column(column: "Column") -> bool:
+	constraints = column.column_constraints
+	if list(filter_type(constraints, Primary)) or list(filter_type(constraints, Unique)):
+		return False
+	return not list(filter_type(constraints, NotNull)) or bool(list(filter_type(constraints, Default)))
+
+
+class SchemaMigration:
+	def __init__(self, database: "Database", renames: Renames = None, copy_batch_size: int = 10_000):
+		self.database = database
+		self.renames = renames or {}
+		self.copy_batch_size = copy_batch_size
+		self.steps: list[str] = []
+
+	def execute(self, sql: str, **parameters):
+		self.database.execute(sql, **parameters).close()
+
+	def query(self, sql: str, **parameters) -> list[tuple]:
+		cur = self.database.execute(sql, **parameters)
+		rows = cur.fetchall()
+		cur.close()
+		return rows
+
+	def run(self) -> list[str]:
+		existing_tables = {name for name, in self.query("SELECT name FROM sqlite_master WHERE type = 'table'")}
+		for table in self.database.tables.values():
+			if table.name in existing_tables:
+				self.migrate_table(table)
+			else:
+				self.create_table(table)
+		return self.steps
+
+	def create_table(self, table: "Table"):
+		self.execute(table.create().build_sql())
+		for create_index in table.create_indexes():
+			self.execute(create_index.build_sql())
+		self.steps.append(f"Created table {table.name}")
+
+	def get_columns(self, table_name: str) -> dict[str, tuple]:
+		# PRAGMA table_info rows: (cid, name, type, notnull, dflt_value, pk)
+		return {row[1]: row for row in self.query(f"PRAGMA table_info({quote_sql_name(table_name)})")}
+
+	def get_foreign_keys(self, table_name: str) -> set[tuple[str, str, str]]:
+		# PRAGMA foreign_key_list rows: (id, seq, table, from, to, on_update, on_delete, match)
+		return {(row[3], row[2], row[4]) for row in self.query(f"PRAGMA foreign_key_list({quote_sql_name(table_name)})")}
+
+	def get_indexes(self, table_name: str) -> dict[str, str]:
+		return dict(self.query("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL", table=table_name))
+
+	@staticmethod
+	def is_column_changed(column: "Column", info: tuple) -> bool:
+		constraints = column.column_constraints
+		primary = bool(list(filter_type(constraints, Primary)))
+		not_null = bool(list(filter_type(constraints, NotNull)))
+		return info[2].upper() != type_to_sql(column.type_) or bool(info[5]) != primary or (bool(info[3]) != not_null and not primary)
+
+	def migrate_table(self, table: "Table"):
+		declared_indexes = {create_index.name: create_index.build_sql() for create_index in table.create_indexes()}
+		for name, sql in self.get_indexes(table.name).items():
+			if declared_indexes.get(name) != sql:
+				self.execute(DropIndex(name).build_sql())
+				self.steps.append(f"Dropped index {name}")
+		columns = self.get_columns(table.name)
+		for old_name, new_name in self.renames.get(table.name, {}).items():
+			if old_name in columns and new_name not in columns and new_name in table.columns:
+				self.execute(AlterTable(table.name).rename_column(old_name, new_name).build_sql())
+				self.steps.append(f"Renamed column {table.name}.{old_name} to {new_name}")
+				columns = self.get_columns(table.name)
+		added = [column for name, column in table.columns.items() if name not in columns]
+		dropped = [name for name in columns if name not in table.columns]
+		declared_foreign_keys = {(column.sql_name, foreign.table, foreign.column) for column in table.columns.values() for foreign in filter_type(column.column_constraints, Foreign)}
+		needs_rebuild = self.get_foreign_keys(table.name) != declared_foreign_keys \
+			or any(self.is_column_changed(column, columns[name]) for name, column in table.columns.items() if name in columns) \
+			or not all(can_add_column(column) for column in added) \
+			or (dropped and not does_sqlite3_supports_drop_column)
+		if not needs_rebuild:
+			for column in added:
+				self.execute(AlterTable(table.name).add_column(column).build_sql())
+				self.steps.append(f"Added column {table.name}.{column.sql_name}")
+			for name in dropped:
+				try:
+					self.execute(AlterTable(table.name).drop_column(name).build_sql())
+					self.steps.append(f"Dropped column {table.name}.{name}")
+				except OperationalError:
+					# SQLite refuses to drop primary, unique, indexed or referenced columns, the table is copied instead
+					needs_rebuild = True
+					break
+		if needs_rebuild:
+			self.rebuild_table(table, [name for name in self.get_columns(table.name) if name in table.columns])
+		existing_indexes = self.get_indexes(table.name)
+		for create_index in table.create_indexes():
+			if create_index.name not in existing_indexes:
+				self.execute(create_index.build_sql())
+				self.steps.append(f"Created index {create_index.name}")
+
+	def rebuild_table(self, table: "Table", copied_columns: list[str]):
+		# The copy-and-swap procedure recommended by SQLite for the changes ALTER TABLE cannot do
+		temporary_name = f"{table.name}_migration"
+		self.execute(DropTable(temporary_name).if_exists().build_sql())
+		create = table.create()
+		create.name = temporary_name
+		self.execute(create.build_sql())
+		columns = join_sql_string(", ", *[quote_sql_name(column) for column in copied_columns])
+		copy = f"INSERT INTO {quote_sql_name(temporary_name)} ({columns}) SELECT {columns} FROM {quote_sql_name(table.name)}"
+		copied = 0
+		bounds = self.query(f"SELECT min(_rowid_), max(_rowid_) FROM {quote_sql_name(table.name)}") if columns and not list(filter_type(table.options, WithoutRowID)) else []
+		if bounds and bounds[0][0] is not None:
+			# Copied by ranges of rowids, so each statement stays short on large tables
+			first, last = bounds[0]
+			for start in range(first, last + 1, self.copy_batch_size):
+				cur = self.database.execute(f"{copy} WHERE _rowid_ BETWEEN :start AND :end", start=start, end=start + self.copy_batch_size - 1)
+				copied += cur.rowcount
+				cur.close()
+		elif columns:
+			cur = self.database.execute(copy)
+			copied += cur.rowcount
+			cur.close()
+		self.execute(table.drop().build_sql())
+		self.execute(AlterTable(temporary_name).rename_table(table.name).build_sql())
+		self.steps.append(f"Rebuilt table {table.name} ({copied} rows copied)")
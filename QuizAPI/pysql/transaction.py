@@ -0,0 +1,53 @@
+from typing import TYPE_CHECKING, Literal
+
+from .common import SQLElement
+from .utils import quote_sql_name, join_sql_string
+
+if TYPE_CHECKING:
+	TransactionMode = Literal["DEFERRED", "IMMEDIATE", "EXCLUSIVE"]
+
+
+class Begin(SQLElement):
+	def __init__(self, mode: "TransactionMode" = None):
+		self.mode = mode
+
+	def with_mode(self, mode: "TransactionMode") -> "Begin":
+		self.mode = mode
+		return self
+
+	def build_sql(self) -> str:
+		return join_sql_string(" ", "BEGIN", self.mode, "TRANSACTION")
+
+
+class Commit(SQLElement):
+	def build_sql(self) -> str:
+		return "COMMIT TRANSACTION"
+
+
+class Rollback(SQLElement):
+	def __init__(self, savepoint: str = None):
+		self.savepoint = savepoint
+
+	def to_savepoint(self, savepoint: str) -> "Rollback":
+		self.savepoint = savepoint
+		return self
+
+	def build_sql(self) -> str:
+		savepoint = f"TO SAVEPOINT {quote_sql_name(self.savepoint)}" if self.savepoint else None
+		return join_sql_string(" ", "ROLLBACK TRANSACTION", savepoint)
+
+
+class Savepoint(SQLElement):
+	def __init__(self, name: str):
+		self.name = name
+
+	def build_sql(self) -> str:
+		return f"SAVEPOINT {quote_sql_name(self.name)}"
+
+
+class Release(SQLElement):
+	def __init__(self, savepoint: str):
+		self.savepoint = savepoint
+
+	def build_sql(self) -> str:
+		return f"RELEASE SAVEPOINT {quote_sql_name(self.savepoint)}"
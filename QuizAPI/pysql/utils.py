@@ -51,6 +51,12 @@ def quote_sql_name(name: SQL) -> str:
 		return quote_name + name.replace(quote_name, quote_name + quote_name) + quote_name
 
 
+def unquote_sql_name(name: str) -> str:
+	if len(name) >= 2 and name[0] == quote_name and name[-1] == quote_name:
+		return name[1:-1].replace(quote_name + quote_name, quote_name)
+	return name
+
+
 def quote_sql_value(value: object) -> str:
 	if isinstance(value, RawSQL):
 		return value.sql
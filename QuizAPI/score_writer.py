@@ -0,0 +1,134 @@
+from atexit import register as at_exit
+from logging import Logger, getLogger
+from os import environ, register_at_fork
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Optional
+
+from flask import Flask
+
+from metrics import app_metrics
+from models import db, Score, APIError, scores_reset
+
+
+class ScoreWriter:
+	def __init__(self, enabled: bool = False, flush_interval: float = 0.05, max_batch_size: int = 500, max_queue_size: int = 10_000, submit_timeout: float = 2.0, max_attempts: int = 3):
+		self.enabled = enabled
+		self.flush_interval = flush_interval
+		self.max_batch_size = max_batch_size
+		self.max_queue_size = max_queue_size
+		self.submit_timeout = submit_timeout
+		self.max_attempts = max_attempts
+		self.logger: Logger = getLogger(__name__)
+		self._lock = Lock()
+		self.reset()
+		at_exit(self.close)
+
+	def install(self, app: Flask):
+		self.logger = app.logger
+
+	def reset(self):
+		# Scores are queued with the generation of the scores table they were submitted for
+		self.queue: Queue[Optional[tuple[Score, int]]] = Queue(self.max_queue_size)
+		self.thread: Optional[Thread] = None
+		self.closed = False
+
+	def reset_after_fork(self):
+		# The writer thread does not survive a fork, each worker starts its own on its first submission
+		self._lock = Lock()
+		self.reset()
+
+	def submit(self, score: Score):
+		if self.enabled:
+			generation = db.get_versions(scores_reset)[0]
+			deadline = monotonic() + self.submit_timeout
+			while True:
+				# Checked and queued under the lock, so a score is never queued once close() has drained the queue
+				with self._lock:
+					if self.closed:
+						break
+					if self.thread is None:
+						self.thread = Thread(target=self.run, name="score-writer", daemon=True)
+						self.thread.start()
+					try:
+						self.queue.put_nowait((score, generation))
+						return
+					except Full:
+						pass
+				# A full queue makes the request wait for a while outside the lock, so the writer can catch up before clients get errors
+				remaining = deadline - monotonic()
+				if remaining <= 0:
+					raise APIError("Too many participations are being saved, please retry later", 503)
+				sleep(min(remaining, 0.01))
+		score.add("id")
+
+	def run(self):
+		while True:
+			batch, stop = self.next_batch()
+			if batch:
+				self.write(batch)
+			for _ in range(len(batch) + stop):
+				self.queue.task_done()
+			if stop:
+				return
+
+	def next_batch(self) -> tuple[list[tuple[Score, int]], bool]:
+		# Waits for a first score, then gathers the others submitted within the flush interval
+		batch, deadline = [], None
+		while len(batch) < self.max_batch_size:
+			try:
+				item = self.queue.get(timeout=None if deadline is None else max(deadline - monotonic(), 0))
+			except Empty:
+				break
+			if item is None:
+				return batch, True
+			batch.append(item)
+			if deadline is None:
+				deadline = monotonic() + self.flush_interval
+		return batch, False
+
+	def write(self, batch: list[tuple[Score, int]]):
+		for attempt in range(1, self.max_attempts + 1):
+			try:
+				with db.transaction():
+					# Scores submitted before the scores were deleted (by any worker) must not reappear after it
+					generation = db.get_versions(scores_reset)[0]
+					scores = [score for score, score_generation in batch if score_generation == generation]
+					Score.add_many(scores, "id")
+				return
+			except Exception:
+				self.logger.warning(f"Failed to write {len(batch)} scores (attempt {attempt} of {self.max_attempts})", exc_info=True)
+				if attempt < self.max_attempts:
+					sleep(0.1 * attempt)
+		self.logger.error(f"Dropped {len(batch)} scores after {self.max_attempts} failed attempts: {', '.join(f'{score.player_name}={score.score}' for score, _ in batch)}")
+		app_metrics.record_dropped_scores(len(batch))
+
+	def wait(self):
+		if self.thread is not None:
+			self.queue.join()
+
+	def close(self):
+		with self._lock:
+			if self.closed:
+				return
+			self.closed = True
+			thread = self.thread
+		if thread is not None:
+			self.queue.put(None)
+			thread.join()
+		# Scores submitted while closing are written synchronously
+		leftover = []
+		while True:
+			try:
+				item = self.queue.get_nowait()
+			except Empty:
+				break
+			if item is not None:
+				leftover.append(item)
+		if leftover:
+			self.write(leftover)
+
+
+score_writer = ScoreWriter(environ.get("APP_SCORE_WRITE_BEHIND", "0") != "0", float(environ.get("APP_SCORE_FLUSH_INTERVAL", 0.05)), int(environ.get("APP_SCORE_BATCH_SIZE", 500)), int(environ.get("APP_SCORE_QUEUE_SIZE", 10_000)))
+register_at_fork(after_in_child=score_writer.reset_after_fork)
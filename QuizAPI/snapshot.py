@@ -0,0 +1,47 @@
+from threading import Lock
+
+from models import db, Question, Answer, APIError, AnswerSummary
+
+
+class QuizSnapshot:
+	def __init__(self, version: tuple[int, ...], questions: list[Question]):
+		self.version = version
+		self.question_ids = [question.id for question in questions]
+		self.answers_counts = [len(question.possible_answers) for question in questions]
+		self.correct_answers = [max((i + 1 for i, answer in enumerate(question.possible_answers) if answer.is_correct), default=0) for question in questions]
+
+	def __len__(self):
+		return len(self.question_ids)
+
+	def check(self, answers: list[int]) -> list[AnswerSummary]:
+		if len(answers) != len(self):
+			raise APIError(f"Incorrect number of answers, expected {len(self)} but received {len(answers)}")
+		for question_id, answer, answers_count in zip(self.question_ids, answers, self.answers_counts):
+			if answer <= 0 or answer > answers_count:
+				raise APIError(f"Invalid answer #{answer} for question #{question_id} (must be between 1 and {answers_count})")
+		return [AnswerSummary(correct, answer == correct) for answer, correct in zip(answers, self.correct_answers)]
+
+
+class QuizSnapshotCache:
+	def __init__(self):
+		self.snapshot = None
+		self._lock = Lock()
+
+	@staticmethod
+	def get_version() -> tuple[int, ...]:
+		return db.get_versions(Question.__table__.name, Answer.__table__.name)
+
+	def get(self) -> QuizSnapshot:
+		snapshot = self.snapshot
+		if snapshot is not None and snapshot.version == self.get_version():
+			return snapshot
+		with self._lock:
+			# Read in one transaction, so the version and the questions come from the same state of the database
+			with db.transaction("DEFERRED"):
+				version = self.get_version()
+				if self.snapshot is None or self.snapshot.version != version:
+					self.snapshot = QuizSnapshot(version, Question.list_with_answers())
+			return self.snapshot
+
+
+quiz_snapshot = QuizSnapshotCache()
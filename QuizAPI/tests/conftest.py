@@ -0,0 +1,19 @@
+import sys
+from hashlib import md5
+from os import chdir, environ, getcwd, path
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# The application opens quiz.db and the images directory relative to the working directory on import
+working_directory = getcwd()
+temporary_directory = TemporaryDirectory(prefix="quiz-tests-")
+chdir(temporary_directory.name)
+environ["FLASK_DEBUG"] = "0"
+environ.setdefault("APP_SECRET", "tests")
+environ["APP_ADMIN_PASSWORD"] = md5(b"tests").hexdigest()
+
+
+def pytest_unconfigure():
+	chdir(working_directory)
+	temporary_directory.cleanup()
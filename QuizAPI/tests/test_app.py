@@ -0,0 +1,46 @@
+import pytest
+
+from app import app
+from tracking import request_tracker
+
+
+def question(position: int, title: str) -> dict:
+	return {"title": title, "text": title, "image": None, "position": position, "possibleAnswers": [{"text": "Yes", "isCorrect": True}, {"text": "No", "isCorrect": False}]}
+
+
+@pytest.fixture
+def request_app(monkeypatch):
+	# Every response is closed, so exceeding a query budget fails the test
+	monkeypatch.setattr(request_tracker, "strict", True)
+	client = app.test_client()
+
+	def request_app(method: str, url: str, payload=None, authenticated: bool = False, status: int = 200):
+		headers = {"Authorization": f"Bearer {token}"} if authenticated else None
+		res = client.open(url, method=method, json=payload, headers=headers)
+		data = res.get_json(silent=True)
+		res.close()
+		assert res.status_code == status, data
+		return data
+
+	token = request_app("POST", "/login", {"password": "tests"})["token"]
+	request_app("POST", "/rebuild-db", authenticated=True)
+	return request_app
+
+
+def test_routes_respect_their_query_budgets(request_app):
+	for i in range(3):
+		request_app("POST", "/questions", question(1, f"Question {i}"), True)
+	request_app("GET", "/quiz-info")
+	request_app("POST", "/participations", {"playerName": "First", "answers": [1, 1, 2]})
+	request_app("GET", "/questions?position=2")
+	request_app("GET", "/questions/1")
+	request_app("PUT", "/questions/1", question(3, "Moved"), True, 204)
+	request_app("PUT", "/questions/2", question(4, "Last"), True, 204)
+	# The quiz snapshot and the leaderboard are outdated by the writes above, and loaded again
+	participation = request_app("POST", "/participations", {"playerName": "Second", "answers": [1, 1, 1]})
+	assert participation["rank"] == 1
+	info = request_app("GET", "/quiz-info")
+	assert info["size"] == 3 and [score["playerName"] for score in info["scores"]] == ["Second", "First"]
+	request_app("DELETE", "/questions/3", authenticated=True, status=204)
+	request_app("DELETE", "/participations/all", authenticated=True, status=204)
+	request_app("POST", "/participations", {"playerName": "Third", "answers": [1, 1]})
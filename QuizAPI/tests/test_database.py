@@ -0,0 +1,235 @@
+import sqlite3
+from math import nextafter
+from sqlite3 import OperationalError
+from threading import Thread
+
+import pytest
+
+from pysql import Database, DatabaseModel, Column, Primary, Index
+
+
+@pytest.fixture
+def databases(tmp_path):
+	# Two databases on the same file behave like two worker processes
+	file = str(tmp_path / "test.db")
+	first = Database(file, connection_per_thread=True, journal_mode="WAL", shared_versions=True)
+	second = Database(file, connection_per_thread=True, journal_mode="WAL", shared_versions=True)
+	first.execute("CREATE TABLE items (value INTEGER)").close()
+	yield first, second
+	first.close()
+	second.close()
+
+
+def test_shared_versions_follow_writes_of_other_databases(databases):
+	first, second = databases
+	before = second.get_versions("items")
+	first.execute("INSERT INTO items VALUES (1)").close()
+	assert second.get_versions("items") != before
+	assert second.get_versions("items") == first.get_versions("items")
+
+
+def test_shared_versions_change_on_commit_only(databases):
+	first, second = databases
+	before = second.get_versions("items")
+	with pytest.raises(KeyError):
+		with first.transaction():
+			first.execute("INSERT INTO items VALUES (1)").close()
+			raise KeyError
+	assert first.get_versions("items") == second.get_versions("items") == before
+	with first.transaction():
+		first.execute("INSERT INTO items VALUES (1)").close()
+		assert second.get_versions("items") == before
+	assert second.get_versions("items") != before
+
+
+def test_standalone_write_commits_with_its_version(databases):
+	first, _ = databases
+	statements = []
+	first.connection.set_trace_callback(statements.append)
+	first.execute("INSERT INTO items VALUES (1)").close()
+	first.connection.set_trace_callback(None)
+	assert [statement.split()[0] for statement in statements] == ["BEGIN", "INSERT", "INSERT", "COMMIT"]
+	assert "pysql_versions" in statements[2]
+
+
+def test_versions_read_in_a_transaction_match_its_data(databases):
+	first, second = databases
+	with second.transaction("DEFERRED"):
+		versions = second.get_versions("items")
+		first.execute("INSERT INTO items VALUES (1)").close()
+		assert second.get_versions("items") == versions
+		assert second.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+	assert second.get_versions("items") == first.get_versions("items") != versions
+
+
+def create_items(file, connection_per_thread):
+	db = Database(file, auto_create_tables=True, connection_per_thread=connection_per_thread, journal_mode="WAL")
+
+	@db.model("items", Column("id", int, Primary(True)), Column("value", int))
+	class Item(DatabaseModel):
+		id: int
+
+		def __init__(self, value: int):
+			self.value = value
+
+	Item.add_many([Item(i) for i in range(10)], "id")
+	return db, Item
+
+
+def run_in_thread(target, timeout: float = 5.0):
+	# A deadlock fails the test instead of blocking the whole run
+	errors = []
+
+	def run():
+		try:
+			target()
+		except BaseException as e:
+			errors.append(e)
+
+	thread = Thread(target=run, daemon=True)
+	thread.start()
+	thread.join(timeout)
+	assert not thread.is_alive(), "deadlock"
+	if errors:
+		raise errors[0]
+
+
+def test_abandoned_iter_closes_its_cursor(tmp_path):
+	db, Item = create_items(str(tmp_path / "test.db"), False)
+	items = Item.iter(batch_size=2)
+	assert next(items).value == 0
+	# A table cannot be dropped while one of its statements is still running on the connection
+	with pytest.raises(OperationalError):
+		db.execute("DROP TABLE items").close()
+	run_in_thread(lambda: Item.count())
+	items.close()
+	run_in_thread(lambda: Item.count())
+	db.execute("DROP TABLE items").close()
+	db.close()
+
+
+@pytest.mark.parametrize("connection_per_thread", [False, True])
+def test_iter_interleaved_with_writes(tmp_path, connection_per_thread):
+	db, Item = create_items(str(tmp_path / "test.db"), connection_per_thread)
+
+	def iterate_and_write():
+		for item in Item.iter(batch_size=3):
+			with db.transaction():
+				item.value += 100
+				item.save()
+			assert Item.count() == 10
+
+	run_in_thread(iterate_and_write)
+	assert [item.value for item in Item.list(order_by="id")] == list(range(100, 110))
+	db.close()
+
+
+def test_add_many_assigns_ids_in_order(tmp_path):
+	db, Item = create_items(str(tmp_path / "test.db"), True)
+	items = [Item(value) for value in (5, 3, 9)]
+	Item.add_many(items, "id")
+	ids = [item.id for item in items]
+	assert ids == sorted(ids) and len(set(ids)) == len(ids)
+	assert [Item.get(id=item.id).value for item in items] == [5, 3, 9]
+	db.close()
+
+
+def test_migration_renames_and_rebuilds_keeping_rows(tmp_path):
+	file = str(tmp_path / "test.db")
+	connection = sqlite3.connect(file)
+	connection.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, label TEXT, amount INTEGER)")
+	connection.execute("CREATE INDEX items_label ON items (label)")
+	connection.executemany("INSERT INTO items VALUES (?, ?, ?)", [(1, "first", 10), (2, "second", 20), (5, "third", 30)])
+	connection.commit()
+	connection.close()
+
+	def open_database():
+		db = Database(file, connection_per_thread=True, journal_mode="WAL")
+
+		@db.model("items", Column("id", int, Primary(True)), Column("name", str), Column("amount", float), Index("amount"))
+		class Item(DatabaseModel):
+			pass
+
+		db.rename_column("items", "label", "name")
+		return db
+
+	db = open_database()
+	steps = db.migrate()
+	assert "Dropped index items_label" in steps
+	assert "Renamed column items.label to name" in steps
+	assert "Rebuilt table items (3 rows copied)" in steps
+	assert "Created index items_amount_index" in steps
+	cur = db.execute("SELECT id, name, amount, typeof(amount) FROM items ORDER BY id")
+	assert cur.fetchall() == [(1, "first", 10.0, "real"), (2, "second", 20.0, "real"), (5, "third", 30.0, "real")]
+	cur.close()
+	cur = db.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'items' AND sql IS NOT NULL")
+	assert cur.fetchall() == [("items_amount_index",)]
+	cur.close()
+	# The fingerprint now matches the declared schema, so nothing is done again, even by another process
+	assert db.migrate() == []
+	db.close()
+	db = open_database()
+	assert db.migrate() == []
+	db.close()
+
+
+@pytest.fixture
+def questions():
+	from models import db, Question
+	db.execute(Question.__table__.delete(False).all_rows(True).build_sql()).close()
+
+	def add(title: str, position: int) -> Question:
+		question = Question(title, title, None, position, [])
+		with db.transaction():
+			question.place_at(position)
+			question.add("id")
+		return question
+
+	yield db, Question, add
+	db.execute(Question.__table__.delete(False).all_rows(True).build_sql()).close()
+
+
+def get_titles(question_class) -> list[str]:
+	return [question.title for question in question_class.list(None, ["sort_key", "id"])]
+
+
+def get_sort_keys(db) -> list[float]:
+	cur = db.execute("SELECT sort_key FROM questions ORDER BY sort_key, id")
+	keys = [sort_key for sort_key, in cur.fetchall()]
+	cur.close()
+	return keys
+
+
+def test_question_moved_to_the_last_position(questions):
+	db, Question, add = questions
+	first, second, third = add("a", 1), add("b", 2), add("c", 3)
+	assert get_titles(Question) == ["a", "b", "c"]
+	with db.transaction():
+		first.place_at(3, Question.get(id=first.id))
+		first.save()
+	assert get_titles(Question) == ["b", "c", "a"]
+	with db.transaction():
+		third.place_at(1, Question.get(id=third.id))
+		third.save()
+	assert get_titles(Question) == ["c", "b", "a"]
+
+
+def test_question_placed_when_the_float_precision_is_exhausted(questions):
+	db, Question, add = questions
+	first, second = add("a", 1), add("b", 2)
+	db.execute("UPDATE questions SET sort_key = :sort_key WHERE id = :id", sort_key=1.0, id=first.id).close()
+	db.execute("UPDATE questions SET sort_key = :sort_key WHERE id = :id", sort_key=nextafter(1.0, 2.0), id=second.id).close()
+	add("c", 2)
+	assert get_titles(Question) == ["a", "c", "b"]
+	keys = get_sort_keys(db)
+	assert all(a < b for a, b in zip(keys, keys[1:]))
+	# Same when an existing question is moved between the two keys
+	db.execute("UPDATE questions SET sort_key = :sort_key WHERE title = 'c'", sort_key=1.0).close()
+	db.execute("UPDATE questions SET sort_key = :sort_key WHERE title = 'a'", sort_key=nextafter(1.0, 2.0)).close()
+	db.execute("UPDATE questions SET sort_key = :sort_key WHERE title = 'b'", sort_key=2.0).close()
+	with db.transaction():
+		second.place_at(2, Question.get(id=second.id))
+		second.save()
+	assert get_titles(Question) == ["c", "b", "a"]
+	keys = get_sort_keys(db)
+	assert all(a < b for a, b in zip(keys, keys[1:]))
@@ -0,0 +1,83 @@
+import pytest
+
+from pyjson import JsonBindings, StdlibJsonBackend, OrjsonBackend, Nullable, orjson
+
+
+backends = [StdlibJsonBackend] + ([OrjsonBackend] if orjson is not None else [])
+
+
+def create_model(indent, backend):
+	json = JsonBindings(indent, backend())
+
+	@json.model(name=str, tags=[str], details=({"score": int}, "itemDetails"))
+	class Item:
+		def __init__(self, name, tags, details):
+			self.name = name
+			self.tags = tags
+			self.details = details
+
+	return Item
+
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("indent", [None, 2, 4])
+@pytest.mark.parametrize("count", [0, 1, 3])
+def test_iter_json_list_matches_to_json_list_bytes(backend, indent, count):
+	Item = create_model(indent, backend)
+	items = [Item(f"item {i}", ["a", "b"][:i], {"score": i}) for i in range(count)]
+	assert b"".join(Item.iter_json_list(items)) == Item.to_json_list_bytes(*items)
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_from_json_lines_reads_lines_one_by_one(backend):
+	Item = create_model(None, backend)
+	items = [Item(f"item {i}", ["a"], {"score": i}) for i in range(3)]
+	json_lines = b"".join(Item.iter_json_lines(items)) + b"\n"
+	assert [item.to_dict() for item in Item.from_json_lines(iter(json_lines.splitlines(True)))] == [item.to_dict() for item in Item.from_json_lines(json_lines)] == [item.to_dict() for item in items]
+
+
+def generic_to_dict(value) -> dict:
+	return {field.json_name: field.json_type.serialize(value.__dict__.get(field.python_name)) for field in type(value).__schema__.fields}
+
+
+def generic_from_dict(model: type, values: dict):
+	value = model.__new__(model)
+	for field in model.__schema__.fields:
+		value.__dict__[field.python_name] = field.json_type.deserialize(values.get(field.json_name))
+	return value
+
+
+def test_compiled_serializers_match_the_generic_json_types():
+	json = JsonBindings()
+
+	@json.model(label=str, weight=float)
+	class Tag:
+		def __init__(self, label, weight):
+			self.label = label
+			self.weight = weight
+
+	@json.model(id=Nullable(int), name=(str, "displayName"), active=bool, ratio=float, tags=([Tag, ...], "allTags"), pair=[int, str], counts={...: int}, details={"score": int, "note": Nullable(str)}, scores=[[int, ...], ...])
+	class Item:
+		def __init__(self, id_, name, active, ratio, tags, pair, counts, details, scores):
+			self.id = id_
+			self.name = name
+			self.active = active
+			self.ratio = ratio
+			self.tags = tags
+			self.pair = pair
+			self.counts = counts
+			self.details = details
+			self.scores = scores
+
+	items = [
+		Item(1, "first", True, 0.5, [Tag("a", 1.0), Tag("b", 2.5)], [1, "x"], {"a": 1, "b": 2}, {"score": 3, "note": "ok"}, [[1, 2], []]),
+		Item(None, "", False, 0.0, [], [0, ""], {}, {"score": 0, "note": None}, [])
+	]
+	for item in items:
+		assert item.to_dict() == generic_to_dict(item)
+		values = item.to_dict()
+		assert Item.from_dict(values).__dict__.keys() == generic_from_dict(Item, values).__dict__.keys()
+		assert generic_to_dict(Item.from_dict(values)) == generic_to_dict(generic_from_dict(Item, values)) == values
+	# Integers are converted as declared, whichever the path
+	values = dict(items[0].to_dict(), ratio=1, id=2)
+	assert type(Item.from_dict(values).ratio) is type(generic_from_dict(Item, values).ratio) is float
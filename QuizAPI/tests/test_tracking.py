@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask, Response, stream_with_context
+
+from models import db
+from tracking import request_tracker, QueryBudgetExceeded
+
+
+@pytest.fixture
+def client(monkeypatch):
+	# The schema is created by the first query, outside of the tested requests
+	db.execute("SELECT 1").close()
+	app = Flask(__name__)
+	monkeypatch.setattr(request_tracker, "strict", True)
+	request_tracker.install(app)
+
+	def run_queries(count: int):
+		for _ in range(count):
+			db.execute("SELECT 1").close()
+
+	@app.route("/within-budget")
+	@request_tracker.query_budget(2)
+	def within_budget():
+		run_queries(2)
+		return "Ok"
+
+	@app.route("/over-budget")
+	@request_tracker.query_budget(1)
+	def over_budget():
+		run_queries(2)
+		return "Ok"
+
+	@app.route("/streamed")
+	@request_tracker.query_budget(1)
+	def streamed():
+		def generate():
+			run_queries(2)
+			yield b"Ok"
+		return Response(stream_with_context(generate()))
+
+	return app.test_client()
+
+
+def test_query_budget_is_respected(client):
+	res = client.get("/within-budget")
+	assert res.status_code == 200
+	assert "sql;dur=" in res.headers["Server-Timing"]
+	res.close()
+
+
+def test_query_budget_exceeded(client):
+	res = client.get("/over-budget")
+	with pytest.raises(QueryBudgetExceeded):
+		res.close()
+
+
+def test_query_budget_counts_streamed_queries(client):
+	res = client.get("/streamed")
+	# The timing would only cover the queries made before streaming
+	assert "Server-Timing" not in res.headers
+	with pytest.raises(QueryBudgetExceeded):
+		res.close()
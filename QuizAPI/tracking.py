@@ -0,0 +1,108 @@
+from collections import Counter
+from functools import wraps
+from os import environ
+from time import perf_counter
+
+from flask import Flask, Response, g, has_request_context, request
+
+from models import db, debug
+from pysql import QueryListener, get_statement_shape, is_transaction_control
+
+
+class QueryBudgetExceeded(AssertionError):
+	pass
+
+
+class RequestStats:
+	def __init__(self):
+		self.start = perf_counter()
+		self.queries = 0
+		self.sql_time = 0.0
+		self.serialization_time = 0.0
+		self.statements = Counter()
+		self.budget = None
+
+	def get_server_timing(self) -> str:
+		total = perf_counter() - self.start
+		return f"sql;dur={self.sql_time * 1000:.2f};desc=\"{self.queries} queries\", serialize;dur={self.serialization_time * 1000:.2f}, total;dur={total * 1000:.2f}"
+
+
+class RequestTracker(QueryListener):
+	def __init__(self, strict: bool = False, repeated_statement_threshold: int = 5):
+		self.strict = strict
+		self.repeated_statement_threshold = repeated_statement_threshold
+
+	@staticmethod
+	def get_stats():
+		return g.get("request_stats") if has_request_context() else None
+
+	def query_executed(self, sql: str, lock_wait: float, duration: float, rows_affected: int):
+		stats = self.get_stats()
+		if stats is None:
+			return
+		stats.sql_time += duration
+		# Transactions are not counted in the budgets, they depend on how the queries are grouped rather than on their number
+		if not is_transaction_control(sql):
+			stats.queries += 1
+			stats.statements[sql] += 1
+
+	def rows_fetched(self, sql: str, rows: int, duration: float):
+		stats = self.get_stats()
+		if stats is not None:
+			stats.sql_time += duration
+
+	def add_serialization_time(self, duration: float):
+		stats = self.get_stats()
+		if stats is not None:
+			stats.serialization_time += duration
+
+	def install(self, app: Flask):
+		app.before_request(self.start_request)
+		app.after_request(self.end_request)
+
+	@staticmethod
+	def start_request():
+		g.request_stats = RequestStats()
+
+	def end_request(self, response: Response) -> Response:
+		stats = self.get_stats()
+		if stats is None:
+			return response
+		# Streamed responses send their headers before the body is generated, their timing is only known once it is sent
+		if not response.is_streamed:
+			response.headers.set("Server-Timing", stats.get_server_timing())
+		endpoint = f"{request.method} {request.path}"
+		response.call_on_close(lambda: self.check(stats, endpoint, response.is_streamed))
+		return response
+
+	def check(self, stats: RequestStats, endpoint: str, streamed: bool = False):
+		if debug:
+			if streamed:
+				print(f"Timing of the streamed response of {endpoint}: {stats.get_server_timing()}")
+			shapes = Counter()
+			for sql, count in stats.statements.items():
+				shapes[get_statement_shape(sql)] += count
+			for shape, count in shapes.items():
+				if count > self.repeated_statement_threshold:
+					print(f"Warning: possible N+1 queries in {endpoint}, the statement ran {count} times: {shape}")
+		if stats.budget is not None and stats.queries > stats.budget:
+			message = f"{endpoint} ran {stats.queries} queries, exceeding its budget of {stats.budget}"
+			if self.strict:
+				raise QueryBudgetExceeded(message)
+			print(f"Warning: {message}")
+
+	def query_budget(self, max_queries: int):
+		def decorator(handler):
+			@wraps(handler)
+			def wrapper(*args, **kwargs):
+				stats = self.get_stats()
+				if stats is not None:
+					stats.budget = max_queries
+				return handler(*args, **kwargs)
+			wrapper.query_budget = max_queries
+			return wrapper
+		return decorator
+
+
+request_tracker = RequestTracker(environ.get("APP_STRICT_QUERY_BUDGET", "0") != "0", int(environ.get("APP_REPEATED_STATEMENT_THRESHOLD", 5)))
+db.add_listener(request_tracker)
@@ -1,13 +1,18 @@
+from codecs import lookup
+from collections.abc import Iterator
 from functools import wraps
+from itertools import chain
 from json import JSONDecodeError
 from re import search
+from time import perf_counter
 from traceback import print_exc
 from typing import Callable
-from flask import Response, request
+from flask import Response, request, stream_with_context
 
 from jwt_utils import decode_token, JwtError
 from models import APIError
 from pyjson import JsonModel
+from tracking import request_tracker
 
 
 def returns_json(handler):
@@ -15,6 +20,10 @@ def returns_json(handler):
 	def wrapper(*args, **kwargs):
 		try:
 			ret = handler(*args, **kwargs)
+			if isinstance(ret, Iterator):
+				# The first model is fetched eagerly, so errors are reported before the response starts streaming
+				first = next(ret, None)
+				ret = [] if first is None else chain([first], ret)
 		except APIError as e:
 			ret = e
 		except Exception as e:
@@ -25,19 +34,29 @@ def returns_json(handler):
 		else:
 			obj = ret
 			code = obj.code if isinstance(obj, APIError) else None
-		if type(obj) is list and len(obj) > 0:
+		start = perf_counter()
+		if isinstance(obj, chain):
+			# noinspection PyUnboundLocalVariable
+			# The first element is always defined when the handler returned a non-empty iterator
+			json_type = type(first)
+			if hasattr(json_type, "iter_json_list"):
+				json = stream_with_context(json_type.iter_json_list(obj))
+			else:
+				return list(obj)
+		elif type(obj) is list and len(obj) > 0:
 			json_type = type(obj[0])
 			for i in range(1, len(obj)):
 				if type(obj[i]) != json_type:
 					return ret
-			if hasattr(json_type, "to_json_list"):
-				json = json_type.to_json_list(*obj)
+			if hasattr(json_type, "to_json_list_bytes"):
+				json = json_type.to_json_list_bytes(*obj)
 			else:
 				return ret
-		elif hasattr(obj, "to_json"):
-			json = obj.to_json()
+		elif hasattr(obj, "to_json_bytes"):
+			json = obj.to_json_bytes()
 		else:
 			return ret
+		request_tracker.add_serialization_time(perf_counter() - start)
 		res = Response(json)
 		res.headers.set("Content-Type", "application/json; charset=utf-8")
 		if code:
@@ -51,30 +70,38 @@ def default_json_validator(obj):
 		obj.validate()
 
 
-def request_model(model: type[JsonModel], is_list: bool = False, validator: Callable[[JsonModel], None] = default_json_validator):
+def request_model(model: type[JsonModel], is_list: bool = False, validator: Callable[[JsonModel], None] = default_json_validator, max_content_length: int = 10_000_000):
 	def decorator(handler):
 		@wraps(handler)
 		def wrapper(*args, **kwargs):
 			content_length = request.content_length
 			if content_length is None:
 				raise APIError("Missing Content-Length HTTP header", 411)
-			if content_length > 10_000_000:
-				raise APIError("Maximum allowed payload size is 10 MB", 413)
+			if content_length > max_content_length:
+				raise APIError(f"Maximum allowed payload size is {max_content_length / 1_000_000:g} MB", 413)
 			content_type = request.content_type
 			charset_in_content_type = search("charset=(\\S+)", content_type) if content_type else None
 			charset = charset_in_content_type[1] if charset_in_content_type else "UTF-8"
+			json_lines = is_list and request.mimetype == "application/x-ndjson"
 			try:
-				content = request.get_data().decode(charset)
+				utf8 = lookup(charset).name == "utf-8"
+				# Newline delimited JSON is parsed line by line as it is received, instead of being read in memory first
+				content = request.stream if json_lines and utf8 else request.get_data()
+				# JSON backends parse UTF-8 bytes directly, other charsets need to be decoded first
+				if not utf8:
+					content = content.decode(charset)
 			except (UnicodeDecodeError, LookupError) as e:
 				raise APIError(f"Invalid encoding: {e}")
 			try:
 				if is_list:
-					payload = model.from_json_list(content)
+					payload = model.from_json_lines(content) if json_lines else model.from_json_list(content)
 					for obj in payload:
 						validator(obj)
 				else:
 					payload = model.from_json(content)
 					validator(payload)
+			except UnicodeDecodeError as e:
+				raise APIError(f"Invalid encoding: {e}")
 			except (JSONDecodeError, TypeError, AttributeError) as e:
 				raise APIError(f"Invalid JSON payload: {e}")
 			return handler(*args, **kwargs, payload=payload)